@@ -1,24 +1,25 @@
 """Analysis and visualization for MCP token consumption experiment."""
 from __future__ import annotations
 import json
+from importlib.util import find_spec
 from typing import Optional
 from token_counter import TokenAccumulator
 
-try:
-    import matplotlib.pyplot as plt
-    HAS_MATPLOTLIB = True
-except ImportError:
-    HAS_MATPLOTLIB = False
+# matplotlib is imported on first chart, not at module import
+HAS_MATPLOTLIB = find_spec("matplotlib") is not None
 
 def compare_paradigms(traditional: TokenAccumulator, code_execution: TokenAccumulator) -> dict:
     """Compare token consumption between paradigms."""
-    trad, code = traditional.summary(), code_execution.summary()
+    return compare_summaries(traditional.summary(), code_execution.summary())
+
+def compare_summaries(trad: dict, code: dict) -> dict:
+    """Compare two TokenAccumulator.summary() dicts (e.g. read back from result_cache)."""
     total_diff = trad["grand_total"] - code["grand_total"]
     total_pct = (total_diff / trad["grand_total"]) * 100 if trad["grand_total"] > 0 else 0
     context_diff = trad["total_context_tokens"] - code["total_context_tokens"]
     context_pct = (context_diff / trad["total_context_tokens"]) * 100 if trad["total_context_tokens"] > 0 else 0
     
-    return {
+    result = {
         "traditional": trad, "code_execution": code,
         "comparison": {
             "total_token_savings": total_diff, "total_savings_percentage": round(total_pct, 2),
@@ -33,6 +34,19 @@ def compare_paradigms(traditional: TokenAccumulator, code_execution: TokenAccumu
             "hypothesis_supported": total_pct >= 50
         }
     }
+    if "by_encoding" in trad and "by_encoding" in code:
+        result["by_encoding"] = {}
+        for name, t in trad["by_encoding"].items():
+            c = code["by_encoding"].get(name)
+            if c is None:
+                continue
+            diff = t["grand_total"] - c["grand_total"]
+            result["by_encoding"][name] = {
+                "traditional": t["grand_total"], "code_execution": c["grand_total"], "total_token_savings": diff,
+                "total_savings_percentage": round(diff / t["grand_total"] * 100, 2) if t["grand_total"] > 0 else 0,
+                "efficiency_multiplier": round(t["grand_total"] / c["grand_total"], 2) if c["grand_total"] > 0 else 0
+            }
+    return result
 
 def print_comparison_table(comparison: dict) -> None:
     """Print formatted comparison table."""
@@ -61,16 +75,15 @@ def print_comparison_table(comparison: dict) -> None:
     print(f"\n{'─' * 70}\nSAVINGS: {comp['total_token_savings']:,} tokens ({comp['total_savings_percentage']}%)")
     print(f"Context Savings: {comp['context_token_savings']:,} tokens ({comp['context_savings_percentage']}%)")
     print(f"Efficiency: {comp['efficiency_multiplier']}x | Hypothesis: {'✓ YES' if theory['hypothesis_supported'] else '✗ NO'}")
+    for name, enc in comparison.get("by_encoding", {}).items():
+        print(f"  {name:<12} {enc['traditional']:>10,} vs {enc['code_execution']:>8,} tokens | "
+              f"{enc['total_savings_percentage']}% savings | {enc['efficiency_multiplier']}x")
     print("=" * 70)
 
-def generate_chart(comparison: dict, output_path: Optional[str] = None) -> None:
-    """Generate comparison bar chart."""
-    if not HAS_MATPLOTLIB:
-        print("[Install matplotlib for charts: pip install matplotlib]")
-        return
-    
+def draw_comparison(fig, comparison: dict) -> None:
+    """Draw the token breakdown and total comparison panels onto a matplotlib Figure."""
     trad, code = comparison["traditional"], comparison["code_execution"]
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
+    ax1, ax2 = fig.subplots(1, 2)
     fig.suptitle('MCP Token Consumption: Traditional vs Code Execution', fontweight='bold')
     
     # Breakdown chart
@@ -93,15 +106,44 @@ def generate_chart(comparison: dict, output_path: Optional[str] = None) -> None:
         ax2.annotate(f'{int(bar.get_height()):,}', xy=(bar.get_x() + bar.get_width()/2, bar.get_height()),
                     ha='center', va='bottom', fontweight='bold')
     ax2.set_ylabel('Total Tokens'); ax2.set_title('Total Consumption'); ax2.grid(axis='y', alpha=0.3)
+    fig.tight_layout()
+
+def generate_chart(comparison: dict, output_path: Optional[str] = None) -> None:
+    """Generate comparison bar chart: saved headlessly to output_path, else shown interactively.
     
-    plt.tight_layout()
+    Saving never touches pyplot, so it works on headless machines and leaves no open figures
+    (see charts.py for batch rendering).
+    """
+    if not HAS_MATPLOTLIB:
+        print("[Install matplotlib for charts: pip install matplotlib]")
+        return
     if output_path:
-        plt.savefig(output_path, dpi=150, bbox_inches='tight')
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=(12, 5))
+        draw_comparison(fig, comparison)
+        fig.savefig(output_path, dpi=150, bbox_inches='tight')
         print(f"[Chart saved: {output_path}]")
+        return
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=(12, 5))
+    draw_comparison(fig, comparison)
     plt.show()
+    plt.close(fig)
 
-def save_results(comparison: dict, output_path: str) -> None:
-    """Save comparison results to JSON."""
+def save_results(comparison: dict, output_path: str) -> bool:
+    """Save comparison results to JSON; an identical existing file is left untouched.
+    
+    Returns whether the file was written.
+    """
+    text = json.dumps(comparison, indent=2)
+    try:
+        with open(output_path) as f:
+            if f.read() == text:
+                print(f"[Results unchanged: {output_path}]")
+                return False
+    except FileNotFoundError:
+        pass
     with open(output_path, 'w') as f:
-        json.dump(comparison, f, indent=2)
+        f.write(text)
     print(f"[Results saved: {output_path}]")
+    return True
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the simulation hot paths.
+
+Measures wall time (median of repeats), ops/s and peak traced memory for
+token counting, single tool calls, discovery, both paradigm simulations at
+several N×M sizes and compare_paradigms. Results can be stored as a JSON
+baseline; later runs compared against it exit non-zero on regression.
+
+Run with: python benchmark.py --save-baseline
+          python benchmark.py --threshold 0.15
+"""
+from __future__ import annotations
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import count_tokens, clear_token_cache, set_persistent_store
+from mock_mcp_server import generate_tool_catalog
+from traditional_mcp import simulate_tool_call, simulate_tool_discovery, run_traditional_simulation, TRAVEL_OPERATIONS
+from code_execution import run_code_execution_simulation
+from analysis import compare_paradigms
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+TOKEN_SIZES = (100, 1_000, 10_000, 100_000)
+SIMULATION_SIZES = ((5, 5), (50, 50), (500, 100))
+DEFAULT_THRESHOLD = 0.25
+# Growth below these is timer or allocator noise, never a regression
+MIN_DELTA = {"wall_seconds": 0.0005, "peak_memory_kb": 64.0}
+
+
+@dataclass
+class BenchmarkCase:
+    """A named workload; `ops` is how many logical operations one call performs."""
+    name: str
+    run: Callable[[], object]
+    ops: int = 1
+    unit: str = "ops"
+
+
+def _sample_text(chars: int) -> str:
+    base = json.dumps({"result": {"content": [{"text": json.dumps(TRAVEL_OPERATIONS, indent=2)}]}}, indent=2)
+    return (base * (chars // len(base) + 1))[:chars]
+
+
+def build_cases() -> list[BenchmarkCase]:
+    cases = []
+    for size in TOKEN_SIZES:
+        text = _sample_text(size)
+        tokens = count_tokens(text)
+
+        def count_cold(text=text):
+            clear_token_cache()  # Measure the encoder, not cache hits
+            return count_tokens(text)
+        cases.append(BenchmarkCase(f"count_tokens[{size}]", count_cold, tokens, "tokens"))
+
+    op = TRAVEL_OPERATIONS[0]
+    cases.append(BenchmarkCase("simulate_tool_call", lambda: simulate_tool_call(op["tool"], op["args"])))
+    for n in (5, 500):
+        catalog = generate_tool_catalog(n)
+        # A plain list builds a fresh registry per call, so schemas are re-serialized each run
+        cases.append(BenchmarkCase(f"simulate_tool_discovery[N={n}]", lambda catalog=catalog: simulate_tool_discovery(catalog)))
+    for n, m in SIMULATION_SIZES:
+        catalog, operations = generate_tool_catalog(n), [TRAVEL_OPERATIONS[i % 5] for i in range(m)]
+        cases.append(BenchmarkCase(f"run_traditional_simulation[N={n},M={m}]",
+                                   lambda c=catalog, o=operations: run_traditional_simulation(o, c), m))
+        cases.append(BenchmarkCase(f"run_code_execution_simulation[N={n},M={m}]",
+                                   lambda c=catalog, o=operations: run_code_execution_simulation(o, tools=c), m))
+    trad, code = run_traditional_simulation(TRAVEL_OPERATIONS), run_code_execution_simulation(TRAVEL_OPERATIONS)
+    cases.append(BenchmarkCase("compare_paradigms", lambda: compare_paradigms(trad, code)))
+    return cases
+
+
+def measure(case: BenchmarkCase, repeats: int) -> dict:
+    """Median wall time over repeats, plus peak traced memory of one extra run."""
+    case.run()  # Warm-up (lazy encoder load, imports)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    wall = statistics.median(times)
+    return {
+        "wall_seconds": round(wall, 6),
+        "ops_per_second": round(case.ops / wall, 1) if wall > 0 else 0.0,
+        "unit": case.unit,
+        "peak_memory_kb": round(peak / 1024, 1)
+    }
+
+
+def run_benchmarks(repeats: int = 5, name_filter: Optional[str] = None) -> dict:
+    set_persistent_store(None)  # Cold cases must encode, not read MCP_TOKEN_STORE from disk
+    results = {}
+    for case in build_cases():
+        if name_filter and name_filter not in case.name:
+            continue
+        results[case.name] = measure(case, repeats)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD,
+                     min_delta: Optional[dict] = None) -> list[str]:
+    """Cases whose wall time or peak memory grew by more than threshold (fraction) over baseline
+    and by at least min_delta (absolute, per metric; default MIN_DELTA)."""
+    min_delta = MIN_DELTA if min_delta is None else min_delta
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for key in ("wall_seconds", "peak_memory_kb"):
+            if (previous[key] > 0 and current[key] > previous[key] * (1 + threshold)
+                    and current[key] - previous[key] >= min_delta.get(key, 0)):
+                regressions.append(f"{name}: {key} {previous[key]} -> {current[key]} "
+                                   f"(+{(current[key] / previous[key] - 1) * 100:.1f}%)")
+    return regressions
+
+
+def print_results(results: dict, baseline: Optional[dict] = None) -> None:
+    print(f"{'Benchmark':<48} {'Wall ms':>10} {'Throughput':>18} {'Peak KB':>10} {'vs base':>8}")
+    print("─" * 98)
+    for name, r in results.items():
+        delta = ""
+        if baseline and name in baseline and baseline[name]["wall_seconds"] > 0:
+            delta = f"{(r['wall_seconds'] / baseline[name]['wall_seconds'] - 1) * 100:+.1f}%"
+        throughput = f"{r['ops_per_second']:,.0f} {r['unit']}/s"
+        print(f"{name:<48} {r['wall_seconds'] * 1000:10.3f} {throughput:>18} {r['peak_memory_kb']:10.1f} {delta:>8}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the MCP simulation hot paths")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON path")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Allowed slowdown/memory growth as a fraction (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--min-wall-ms", type=float, default=MIN_DELTA["wall_seconds"] * 1000,
+                        help="Ignore wall time growth smaller than this (ms)")
+    parser.add_argument("--min-memory-kb", type=float, default=MIN_DELTA["peak_memory_kb"],
+                        help="Ignore peak memory growth smaller than this (KB)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeats, args.filter)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"[Baseline saved: {args.baseline}]")
+    elif baseline is not None:
+        regressions = find_regressions(results, baseline, args.threshold,
+                                       {"wall_seconds": args.min_wall_ms / 1000, "peak_memory_kb": args.min_memory_kb})
+        if regressions:
+            print(f"\n✗ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n✓ No regressions beyond {args.threshold:.0%}")
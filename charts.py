@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Headless batch chart rendering for sweeps and stored results.
+
+Charts are drawn on matplotlib Figure objects with the Agg backend (forced
+in every worker), so nothing is shown, no pyplot state accumulates and each
+worker reuses one cleared figure per chart kind. Jobs are spread over a
+process pool. For every run and encoder it renders:
+
+  savings_heatmap     savings % over the N×M grid
+  savings_by_n        savings % vs M, one line per N
+  tokens_n<N>         both paradigms' total tokens vs M for one N
+  scenario_*          (--scenario-charts) analysis.generate_chart per cell
+
+Input is a sweep.py JSON-lines file or a results_store.py database.
+
+Run with: python charts.py --db results.db --run latest --output charts --workers 4
+"""
+from __future__ import annotations
+import json
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analysis import draw_comparison
+
+TRADITIONAL_COLOR, CODE_EXECUTION_COLOR = '#e74c3c', '#27ae60'
+FIGURE_SIZES = {"savings_heatmap": (10, 7), "savings_by_n": (10, 6), "tokens": (8, 5), "comparison": (12, 5)}
+
+_figures: dict = {}  # Per-process figure reused for each chart kind
+
+
+def _init_worker() -> None:
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+
+
+def _figure(kind: str):
+    from matplotlib.figure import Figure
+    fig = _figures.get(kind)
+    if fig is None:
+        fig = _figures[kind] = Figure(figsize=FIGURE_SIZES[kind])
+    else:
+        fig.clear()
+    return fig
+
+
+def _mean_grid(rows: list[dict], field: str) -> dict[tuple[int, int], float]:
+    """Mean of a field per (N, M); repeated scenarios in a run are averaged."""
+    sums = defaultdict(lambda: [0.0, 0])
+    for r in rows:
+        s = sums[r["n_tools"], r["n_operations"]]
+        s[0] += r[field]
+        s[1] += 1
+    return {key: total / count for key, (total, count) in sums.items()}
+
+
+def _log_x_if_wide(ax, values: Iterable[float]) -> None:
+    values = list(values)
+    if values and min(values) > 0 and max(values) / min(values) >= 20:
+        ax.set_xscale("log")
+
+
+def draw_savings_heatmap(fig, rows: list[dict]) -> None:
+    import numpy as np
+    savings = _mean_grid(rows, "savings_percentage")
+    ns = sorted({n for n, _ in savings})
+    ms = sorted({m for _, m in savings})
+    grid = np.full((len(ns), len(ms)), np.nan)
+    for (n, m), value in savings.items():
+        grid[ns.index(n), ms.index(m)] = value
+    ax = fig.subplots()
+    image = ax.imshow(grid, origin="lower", aspect="auto", cmap="RdYlGn", vmin=min(0.0, np.nanmin(grid)), vmax=100)
+    ax.set_xticks(range(len(ms)), labels=[str(m) for m in ms], rotation=45 if len(ms) > 10 else 0)
+    ax.set_yticks(range(len(ns)), labels=[str(n) for n in ns])
+    ax.set_xlabel("Operations (M)"); ax.set_ylabel("Tools (N)")
+    ax.set_title("Code Execution Token Savings over Traditional MCP (%)", fontweight="bold")
+    if len(ns) * len(ms) <= 400:
+        for i in range(len(ns)):
+            for j in range(len(ms)):
+                if not math.isnan(grid[i, j]):
+                    ax.text(j, i, f"{grid[i, j]:.1f}", ha="center", va="center", fontsize=7)
+    fig.colorbar(image, ax=ax, label="Savings %")
+    fig.tight_layout()
+
+
+def draw_savings_by_n(fig, rows: list[dict]) -> None:
+    savings = _mean_grid(rows, "savings_percentage")
+    ax = fig.subplots()
+    for n in sorted({n for n, _ in savings}):
+        points = sorted((m, v) for (n2, m), v in savings.items() if n2 == n)
+        ax.plot([m for m, _ in points], [v for _, v in points], marker="o", markersize=3, label=f"N={n}")
+    _log_x_if_wide(ax, (m for _, m in savings))
+    ax.set_xlabel("Operations (M)"); ax.set_ylabel("Savings %")
+    ax.set_title("Token Savings vs Operations, per Catalog Size", fontweight="bold")
+    ax.grid(alpha=0.3)
+    ax.legend(fontsize=7, ncol=max(1, len(ax.lines) // 12))
+    fig.tight_layout()
+
+
+def draw_tokens(fig, rows: list[dict]) -> None:
+    traditional = _mean_grid(rows, "traditional_total")
+    code_execution = _mean_grid(rows, "code_execution_total")
+    keys = sorted(traditional, key=lambda k: k[1])
+    ms = [m for _, m in keys]
+    ax = fig.subplots()
+    ax.plot(ms, [traditional[k] for k in keys], marker="o", color=TRADITIONAL_COLOR, label="Traditional (O(N×M))")
+    ax.plot(ms, [code_execution[k] for k in keys], marker="o", color=CODE_EXECUTION_COLOR, label="Code Execution (O(N+M))")
+    _log_x_if_wide(ax, ms)
+    if code_execution and min(code_execution.values()) > 0:
+        ax.set_yscale("log")
+    ax.set_xlabel("Operations (M)"); ax.set_ylabel("Total Tokens")
+    ax.set_title(f"Total Tokens vs Operations (N={keys[0][0]} tools)", fontweight="bold")
+    ax.grid(alpha=0.3); ax.legend()
+    fig.tight_layout()
+
+
+_DRAW = {"savings_heatmap": draw_savings_heatmap, "savings_by_n": draw_savings_by_n,
+         "tokens": draw_tokens, "comparison": draw_comparison}
+
+
+def render_job(job: tuple[str, object, str], output_dir: str, dpi: int = 100) -> str:
+    """Draw one (kind, data, file name) job into output_dir and return the path."""
+    kind, data, name = job
+    fig = _figure(kind)
+    _DRAW[kind](fig, data)
+    path = os.path.join(output_dir, name)
+    fig.savefig(path, dpi=dpi)
+    return path
+
+
+def plan_charts(rows: list[dict], prefix: str = "", comparisons: Iterable[dict] = ()) -> list[tuple[str, object, str]]:
+    """Jobs for one run and encoder: heatmap, savings-by-N, per-N token curves and optional scenario charts."""
+    by_n = defaultdict(list)
+    for r in rows:
+        by_n[r["n_tools"]].append(r)
+    jobs = [("savings_heatmap", rows, f"{prefix}savings_heatmap.png"),
+            ("savings_by_n", rows, f"{prefix}savings_by_n.png")]
+    jobs += [("tokens", points, f"{prefix}tokens_n{n}.png") for n, points in sorted(by_n.items())]
+    jobs += [("comparison", c, f"{prefix}scenario_n{c['n_tools']}_m{c['n_operations']}.png") for c in comparisons]
+    return jobs
+
+
+def render_charts(jobs: list[tuple[str, object, str]], output_dir: str, workers: Optional[int] = None,
+                  dpi: int = 100) -> list[str]:
+    """Render jobs across a process pool (in-process with workers=1); returns the written paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    render = partial(render_job, output_dir=output_dir, dpi=dpi)
+    if workers == 1 or len(jobs) <= 1:
+        _init_worker()
+        return [render(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return list(pool.map(render, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+
+
+def sweep_rows(path: str) -> tuple[list[dict], list[dict]]:
+    """Chart rows and scenario comparisons from a sweep.py JSON-lines file."""
+    rows, cells = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            cell = json.loads(line)
+            cells.append(cell)
+            rows.append({"n_tools": cell["n_tools"], "n_operations": cell["n_operations"],
+                         "traditional_total": cell["traditional"]["grand_total"],
+                         "code_execution_total": cell["code_execution"]["grand_total"],
+                         "savings_percentage": cell["comparison"]["total_savings_percentage"]})
+    return rows, cells
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render sweep charts headlessly across a process pool")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--sweep", help="sweep.py JSON-lines output")
+    source.add_argument("--db", help="results_store.py database")
+    parser.add_argument("--run", default="latest", help="run_id or 'latest' (with --db)")
+    parser.add_argument("--encoder", help="Only this encoder (with --db; default every encoder in the run)")
+    parser.add_argument("--output", default="charts", help="Output directory")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--scenario-charts", action="store_true", help="Also render one comparison chart per cell")
+
+    args = parser.parse_args()
+
+    jobs = []
+    if args.sweep:
+        rows, cells = sweep_rows(args.sweep)
+        jobs = plan_charts(rows, comparisons=cells if args.scenario_charts else ())
+    else:
+        from results_store import ResultsStore
+        with ResultsStore(args.db) as store:
+            run_id = store.latest_run() if args.run == "latest" else int(args.run)
+            grid = store.grid({"run_id": run_id, "encoder": args.encoder})
+            by_encoder = defaultdict(list)
+            for r in grid:
+                by_encoder[r["encoder"]].append(r)
+            for encoder, rows in by_encoder.items():
+                comparisons = []
+                if args.scenario_charts:
+                    comparisons = [{**c, **c["scenario"]} for c in store.comparisons({"run_id": run_id, "encoder": encoder})]
+                jobs += plan_charts(rows, f"run{run_id}_{encoder}_", comparisons)
+    if not jobs:
+        sys.exit("No results to chart")
+
+    start = time.perf_counter()
+    paths = render_charts(jobs, args.output, args.workers, args.dpi)
+    print(f"[Rendered {len(paths)} charts in {time.perf_counter() - start:.1f}s: {args.output}]")
@@ -1,7 +1,9 @@
 """Code Execution Paradigm simulation - O(N+M) token pattern."""
 from __future__ import annotations
-import json
 from token_counter import count_tokens, TokenMetrics, TokenAccumulator
+from mock_mcp_server import MCPTool, ToolRegistry, MOCK_RESPONSES, as_registry
+from instrumentation import stage
+from wire_formats import get_wire_format
 
 SYSTEM_PROMPT = """You are a travel assistant using code execution paradigm.
 Express intentions at high level. Infrastructure handles:
@@ -17,28 +19,77 @@ CAPABILITY_MANIFEST = """## Capabilities
 - calendar.availability: Check schedule
 Priority hints: speed (0-1), quality (0-1), cost (0-1)"""
 
-def simulate_batch_execution() -> TokenMetrics:
-    """Simulate batch execution of search operations."""
-    batch_request = {"intent": "travel_planning", "requirements": [
-        {"type": "flights", "from": "JFK", "to": "CDG", "dates": "2024-03-15 to 2024-03-22"},
-        {"type": "weather", "location": "Paris"},
-        {"type": "hotels", "location": "Paris", "dates": "same"},
-        {"type": "calendar", "check": "conflicts"}
-    ], "priorities": {"speed": 0.6, "quality": 0.8, "cost": 0.7}}
+BATCH_REQUEST = {"intent": "travel_planning", "requirements": [
+    {"type": "flights", "from": "JFK", "to": "CDG", "dates": "2024-03-15 to 2024-03-22"},
+    {"type": "weather", "location": "Paris"},
+    {"type": "hotels", "location": "Paris", "dates": "same"},
+    {"type": "calendar", "check": "conflicts"}
+], "priorities": {"speed": 0.6, "quality": 0.8, "cost": 0.7}}
+
+AGGREGATED_RESPONSE = {"status": "complete", "results": {
+    "flight_options": 2, "best_flight": {"price": 385, "airline": "United"},
+    "weather_summary": "Mild, 15-20°C, some rain expected",
+    "hotel_options": 2, "recommended_hotel": {"name": "Boutique Montmartre", "price": 150},
+    "calendar_status": "Available with 2 minor conflicts", "total_estimated_cost": 1785
+}, "recommendations": ["Book United flight", "Boutique Montmartre highly rated"]}
+
+# Batch requirement type for each search tool; bookings stay separate intents
+OPERATION_REQUIREMENTS = {"search_flights": "flights", "check_weather": "weather",
+                          "search_hotels": "hotels", "check_calendar": "calendar"}
+BOOKING_TOOL = "create_booking"
+
+def batch_intent(operations: list[dict]) -> dict:
+    """The batch intent document for an operation list: one requirement per search operation."""
+    requirements = []
+    for op in operations:
+        kind, a = OPERATION_REQUIREMENTS.get(op["tool"]), op["args"]
+        if kind == "flights":
+            requirements.append({"type": kind, "from": a["origin"], "to": a["destination"],
+                                 "dates": f"{a['departure_date']} to {a.get('return_date', a['departure_date'])}"})
+        elif kind == "weather":
+            requirements.append({"type": kind, "location": a["location"]})
+        elif kind == "hotels":
+            requirements.append({"type": kind, "location": a["destination"],
+                                 "dates": f"{a['check_in']} to {a['check_out']}"})
+        elif kind == "calendar":
+            requirements.append({"type": kind, "check": "conflicts", "dates": f"{a['start_date']} to {a['end_date']}"})
+        elif op["tool"] != BOOKING_TOOL:
+            raise ValueError(f"no batch requirement for tool {op['tool']!r}")
+    return {"intent": BATCH_REQUEST["intent"], "requirements": requirements, "priorities": BATCH_REQUEST["priorities"]}
+
+def simulate_catalog_discovery(registry: ToolRegistry, tool_names: list[str]) -> TokenMetrics:
+    """Progressive discovery: list the catalog's tool names, then load only the schemas that are used."""
+    used = [name for name in dict.fromkeys(tool_names) if name in registry]
+    response = registry.memo("code_execution.tool_index",
+                             lambda: count_tokens("\n".join(t.qualified_name for t in registry)))
+    for name in used:
+        response += registry.schema_tokens(name)
+    return TokenMetrics(
+        reasoning_tokens=count_tokens("Finding the tools this task needs."),
+        tool_call_tokens=count_tokens(get_wire_format().encode({"list_tools": True, "load": used})),
+        response_tokens=response
+    )
+
+def simulate_batch_execution(aggregated_response: dict | None = None, batch_request: dict | None = None) -> TokenMetrics:
+    """Simulate batch execution of search operations.
     
-    aggregated_response = {"status": "complete", "results": {
-        "flight_options": 2, "best_flight": {"price": 385, "airline": "United"},
-        "weather_summary": "Mild, 15-20°C, some rain expected",
-        "hotel_options": 2, "recommended_hotel": {"name": "Boutique Montmartre", "price": 150},
-        "calendar_status": "Available with 2 minor conflicts", "total_estimated_cost": 1785
-    }, "recommendations": ["Book United flight", "Boutique Montmartre highly rated"]}
+    Uses the canned BATCH_REQUEST and AGGREGATED_RESPONSE unless others (e.g. from sandbox.py) are given.
+    """
+    if aggregated_response is None:
+        aggregated_response = AGGREGATED_RESPONSE
+    if batch_request is None:
+        batch_request = BATCH_REQUEST
     
     reasoning = "Requesting aggregated travel analysis. System handles tool execution."
-    return TokenMetrics(
-        reasoning_tokens=count_tokens(reasoning),
-        tool_call_tokens=count_tokens(json.dumps(batch_request, indent=2)),
-        response_tokens=count_tokens(json.dumps(aggregated_response, indent=2))
-    )
+    with stage("batch.serialize"):
+        request_text = get_wire_format().encode(batch_request)
+        response_text = get_wire_format().encode(aggregated_response)
+    with stage("batch.tokenize"):
+        return TokenMetrics(
+            reasoning_tokens=count_tokens(reasoning),
+            tool_call_tokens=count_tokens(request_text),
+            response_tokens=count_tokens(response_text)
+        )
 
 def simulate_booking_intent() -> TokenMetrics:
     """Simulate booking step as separate intent."""
@@ -46,19 +97,43 @@ def simulate_booking_intent() -> TokenMetrics:
     response = {"status": "confirmed", "booking_ref": "BK-2024-12345", "total": 835.00}
     return TokenMetrics(
         reasoning_tokens=count_tokens("Proceeding with booking."),
-        tool_call_tokens=count_tokens(json.dumps(intent, indent=2)),
-        response_tokens=count_tokens(json.dumps(response, indent=2))
+        tool_call_tokens=count_tokens(get_wire_format().encode(intent)),
+        response_tokens=count_tokens(get_wire_format().encode(response))
     )
 
-def run_code_execution_simulation(operations: list[dict]) -> TokenAccumulator:
-    """Run full Code Execution paradigm simulation."""
+def run_code_execution_simulation(operations: list[dict], batch_response: dict | None = None,
+                                  tools: ToolRegistry | list[MCPTool] | None = None) -> TokenAccumulator:
+    """Run full Code Execution paradigm simulation.
+    
+    Without tools this is the fixed travel scenario: the canned batch intent and summary
+    (batch_response overrides the summary), whatever the operations. With a tool catalog,
+    discovery of the used tools is charged against it, the batch intent is built from the
+    operations and aggregated by sandbox.py over the mock responses, and each booking is
+    its own intent, so totals grow with N and M.
+    """
     acc = TokenAccumulator("Code Execution")
-    acc.initial_context_tokens = count_tokens(SYSTEM_PROMPT + "\n\n" + CAPABILITY_MANIFEST)
+    with stage("code_execution.context"):
+        acc.initial_context_tokens = count_tokens(SYSTEM_PROMPT + "\n\n" + CAPABILITY_MANIFEST)
+    
+    if tools is not None:
+        from sandbox import plan_calls, aggregate  # sandbox imports this module
+        with stage("code_execution.operations"):
+            acc.add_operation(simulate_catalog_discovery(as_registry(tools), [op["tool"] for op in operations]))
+            batch = batch_intent(operations)
+            if batch["requirements"]:
+                calls = plan_calls(batch)
+                summary = aggregate(calls, [MOCK_RESPONSES[tool] for _, tool, _ in calls])
+                acc.add_operation(simulate_batch_execution(summary, batch))
+            for op in operations:
+                if op["tool"] == BOOKING_TOOL:
+                    acc.add_operation(simulate_booking_intent())
+        return acc
     
-    # Batch all search operations into single intent
-    acc.add_operation(simulate_batch_execution())
-    # Booking as separate action
-    acc.add_operation(simulate_booking_intent())
+    with stage("code_execution.operations"):
+        # Batch all search operations into single intent
+        acc.add_operation(simulate_batch_execution(batch_response))
+        # Booking as separate action
+        acc.add_operation(simulate_booking_intent())
     return acc
 
 if __name__ == "__main__":
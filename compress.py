@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Streaming COMPRESS stage for large tool responses.
+
+The traditional paradigm passes a tool's whole JSON payload through
+simulate_tool_call into the model's context. On the code-execution path
+the sandbox can instead reduce rows as they arrive: StreamingCompressor
+applies filters, keeps a bounded top-k heap, running min/max/mean
+statistics and per-group aggregates, so memory stays proportional to k
+and the number of groups rather than to the response size. Only the
+resulting summary is tokenized for the model.
+
+compare_compression runs both paths over a generated response from
+mock_mcp_server.iter_response_rows and reports tokens, token reduction,
+elapsed time and tracemalloc high-water marks.
+
+Run with: python compress.py --tool search_flights --rows 50000 --where "stops<=1" --top-k 5
+"""
+from __future__ import annotations
+import heapq
+import json
+import operator
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field, asdict, replace
+from typing import Callable, Iterable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import count_tokens, clear_token_cache
+from mock_mcp_server import LARGE_RESPONSE_ROWS, iter_response_rows, iter_large_response_json, generate_large_response
+from instrumentation import stage
+from wire_formats import JSON_INDENT, WIRE_FORMATS, get_wire_format, set_wire_format
+
+_COMPARISONS = (("<=", operator.le), (">=", operator.ge), ("!=", operator.ne),
+                ("<", operator.lt), (">", operator.gt), ("=", operator.eq))
+_ORDERING = {"<=", ">=", "<", ">"}
+
+
+def parse_condition(expr: str, sample: Optional[dict] = None) -> Callable[[dict], bool]:
+    """Turn "field<op>value" (ops: <=, >=, !=, <, >, =) into a row predicate; numeric values compare as numbers.
+    
+    Ordering ops need a numeric value; with a sample row, the field must exist and hold the value's type.
+    """
+    for symbol, compare in _COMPARISONS:
+        name, sep, raw = expr.partition(symbol)
+        if sep:
+            name, raw = name.strip(), raw.strip()
+            try:
+                value = float(raw)
+            except ValueError:
+                value = raw
+            if symbol in _ORDERING and isinstance(value, str):
+                raise ValueError(f"invalid condition {expr!r}; {symbol} needs a numeric value")
+            if sample is not None:
+                if name not in sample:
+                    raise ValueError(f"invalid condition {expr!r}; unknown field {name!r}")
+                if isinstance(sample[name], (int, float)) != isinstance(value, float):
+                    kind = "numeric" if isinstance(sample[name], (int, float)) else "text"
+                    raise ValueError(f"invalid condition {expr!r}; {name} is {kind}")
+            return lambda row: name in row and compare(row[name], value)
+    raise ValueError(f"invalid condition {expr!r}; expected field<op>value")
+
+
+@dataclass
+class CompressSpec:
+    """What the COMPRESS stage keeps from a stream of rows."""
+    where: list[str] = field(default_factory=list)  # Conditions, all must hold
+    rank_by: Optional[str] = None                   # Field ranking the top-k rows
+    descending: bool = False                        # Rank highest first (default lowest first)
+    top_k: int = 5
+    stats: tuple[str, ...] = ()                     # Fields to report min/max/mean for
+    group_by: Optional[str] = None
+    group_value: Optional[str] = None               # Field aggregated per group (count only if None)
+
+
+DEFAULT_SPECS = {
+    "search_flights": CompressSpec(rank_by="price", stats=("price", "duration_minutes"),
+                                   group_by="airline", group_value="price"),
+    "search_hotels": CompressSpec(rank_by="rating", descending=True, stats=("price_per_night", "rating"),
+                                  group_by="stars", group_value="price_per_night"),
+}
+
+
+class StreamingCompressor:
+    """Reduces rows incrementally: filter, bounded top-k, running stats and group-by."""
+
+    def __init__(self, spec: CompressSpec):
+        self.spec = spec
+        self._filters = [parse_condition(c) for c in spec.where]
+        self._top: list[tuple] = []  # Min-heap of (rank key, -sequence, row) holding the best k rows
+        self._stats = {name: [float("inf"), float("-inf"), 0.0] for name in spec.stats}  # min, max, sum
+        self._groups: dict = {}  # group -> [count, min, sum]
+        self.rows_scanned = 0
+        self.rows_matched = 0
+
+    def feed(self, row: dict) -> None:
+        self.rows_scanned += 1
+        for condition in self._filters:
+            if not condition(row):
+                return
+        self.rows_matched += 1
+        for name, s in self._stats.items():
+            value = row[name]
+            if value < s[0]:
+                s[0] = value
+            if value > s[1]:
+                s[1] = value
+            s[2] += value
+        spec = self.spec
+        if spec.group_by is not None:
+            g = self._groups.get(row[spec.group_by])
+            if g is None:
+                g = self._groups[row[spec.group_by]] = [0, float("inf"), 0.0]
+            g[0] += 1
+            if spec.group_value is not None:
+                value = row[spec.group_value]
+                if value < g[1]:
+                    g[1] = value
+                g[2] += value
+        if spec.rank_by is not None and spec.top_k > 0:
+            # Larger key = better; ties keep the earlier row
+            key = row[spec.rank_by] if spec.descending else -row[spec.rank_by]
+            item = (key, -self.rows_matched, row)
+            if len(self._top) < spec.top_k:
+                heapq.heappush(self._top, item)
+            elif item > self._top[0]:
+                heapq.heapreplace(self._top, item)
+
+    def consume(self, rows: Iterable[dict]) -> StreamingCompressor:
+        for row in rows:
+            self.feed(row)
+        return self
+
+    def result(self) -> dict:
+        """The compressed summary handed back to the model."""
+        n = self.rows_matched
+        out: dict = {"rows_scanned": self.rows_scanned, "rows_matched": n}
+        if self.spec.rank_by is not None:
+            out["top"] = [row for _, _, row in sorted(self._top, reverse=True)]
+        if self._stats and n:
+            out["stats"] = {name: {"min": s[0], "max": s[1], "mean": round(s[2] / n, 2)}
+                            for name, s in self._stats.items()}
+        if self.spec.group_by is not None:
+            groups = sorted(self._groups.items(), key=lambda item: (-item[1][0], str(item[0])))
+            out["groups"] = {
+                str(key): ({"count": g[0], "min": g[1], "mean": round(g[2] / g[0], 2)}
+                           if self.spec.group_value is not None else {"count": g[0]})
+                for key, g in groups
+            }
+        return out
+
+
+def compress_rows(rows: Iterable[dict], spec: CompressSpec) -> dict:
+    """Run the COMPRESS stage over a row stream and return the summary."""
+    with stage("compress.stream"):
+        return StreamingCompressor(spec).consume(rows).result()
+
+
+def _measure(run: Callable[[], int]) -> tuple[int, float, int]:
+    """(tokens, elapsed seconds, peak traced bytes); timed untraced, peak from a second traced run."""
+    clear_token_cache()
+    start = time.perf_counter()
+    tokens = run()
+    elapsed = time.perf_counter() - start
+    clear_token_cache()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tokens, elapsed, peak
+
+
+def compare_compression(tool_name: str, rows: int, spec: Optional[CompressSpec] = None, seed: int = 0,
+                        stream_count: bool = False) -> dict:
+    """Tokens, time and memory high-water mark: raw payload via simulate_tool_call vs streaming COMPRESS.
+    
+    Payloads use the active wire format. With stream_count, the raw payload is counted chunk
+    by chunk (same count, bounded memory); streaming produces indent=2 JSON only.
+    """
+    fmt = get_wire_format()
+    if stream_count and fmt is not JSON_INDENT:
+        raise ValueError("stream_count streams indent=2 JSON; select the json wire format")
+    from traditional_mcp import simulate_tool_call, count_response_stream, TRAVEL_OPERATIONS
+    spec = spec or DEFAULT_SPECS[tool_name]
+    args = next((op["args"] for op in TRAVEL_OPERATIONS if op["tool"] == tool_name), {})
+    summary: dict = {}
+
+    def traditional() -> int:
+        if stream_count:
+            return count_response_stream(iter_large_response_json(tool_name, rows, seed))
+        text = fmt.encode(generate_large_response(tool_name, rows, seed))
+        return simulate_tool_call(tool_name, args, text).response_tokens
+
+    def streaming() -> int:
+        summary.update(compress_rows(iter_response_rows(tool_name, rows, seed), spec))
+        return count_tokens(fmt.encode(summary))
+
+    raw_tokens, raw_seconds, raw_peak = _measure(traditional)
+    compressed_tokens, stream_seconds, stream_peak = _measure(streaming)
+    return {
+        "tool": tool_name, "rows": rows, "spec": asdict(spec),
+        "traditional": {"response_tokens": raw_tokens, "streamed_count": stream_count, "elapsed_seconds": round(raw_seconds, 4),
+                        "peak_memory_kb": round(raw_peak / 1024, 1)},
+        "code_execution": {"response_tokens": compressed_tokens, "elapsed_seconds": round(stream_seconds, 4),
+                           "peak_memory_kb": round(stream_peak / 1024, 1),
+                           "rows_per_second": round(rows / stream_seconds) if stream_seconds > 0 else 0},
+        "token_reduction_percentage": round((1 - compressed_tokens / raw_tokens) * 100, 2) if raw_tokens else 0.0,
+        "summary": summary
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Streaming COMPRESS stage vs raw tool payloads")
+    parser.add_argument("--tool", choices=sorted(LARGE_RESPONSE_ROWS), default="search_flights")
+    parser.add_argument("--rows", type=int, default=50_000, help="Rows in the generated response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--where", action="append", default=[], help="Filter condition, e.g. 'stops<=1' (repeatable)")
+    parser.add_argument("--rank-by", help="Top-k ranking field (default per tool)")
+    parser.add_argument("--descending", action="store_true", help="Rank highest values first")
+    parser.add_argument("--top-k", type=int, help="Rows kept in the summary")
+    parser.add_argument("--group-by", help="Group-by field (default per tool)")
+    parser.add_argument("--stream-count", action="store_true",
+                        help="Count the raw payload chunk by chunk instead of materializing it")
+    parser.add_argument("--wire-format", choices=sorted(WIRE_FORMATS), default="json",
+                        help="Encoding of the raw payload and the summary")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+    set_wire_format(args.wire_format)
+
+    sample = next(iter_response_rows(args.tool, 1, args.seed))
+    for condition in args.where:
+        try:
+            parse_condition(condition, sample)
+        except ValueError as e:
+            parser.error(str(e))
+    spec = replace(DEFAULT_SPECS[args.tool], where=args.where)
+    if args.rank_by:
+        spec = replace(spec, rank_by=args.rank_by, descending=args.descending)
+    elif args.descending:
+        spec = replace(spec, descending=True)
+    if args.top_k is not None:
+        spec = replace(spec, top_k=args.top_k)
+    if args.group_by:
+        spec = replace(spec, group_by=args.group_by)
+    result = compare_compression(args.tool, args.rows, spec, args.seed, args.stream_count)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        trad, code = result["traditional"], result["code_execution"]
+        print(f"{args.tool}: {args.rows:,} rows, {result['summary']['rows_matched']:,} matched")
+        print(f"  Traditional (raw payload):  {trad['response_tokens']:>12,} tokens | "
+              f"{trad['elapsed_seconds']:.3f}s | peak {trad['peak_memory_kb']:,.1f} KB")
+        print(f"  Code execution (COMPRESS):  {code['response_tokens']:>12,} tokens | "
+              f"{code['elapsed_seconds']:.3f}s | peak {code['peak_memory_kb']:,.1f} KB")
+        print(f"  Token reduction: {result['token_reduction_percentage']}%")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Vectorized analytical cost model for both paradigms.
+
+Calibrates, once, from the real simulations:
+  - per-tool schema cost (initial context + discovery, and per-op reload)
+  - per-call envelope cost (reasoning + JSON-RPC request)
+  - per-response cost (scaled by a response-size multiplier R)
+  - the code-execution fixed, per-tool (catalog listing), per-loaded-schema
+    and per-operation cost, fitted to catalog-driven code-execution runs
+then evaluates token totals over whole (N, M, R) grids in one NumPy pass.
+validate() re-runs the full simulations at sampled grid points.
+
+Run with: python cost_model.py --tools 5:5000:40 --ops 1:1000:40 --validate 10
+          python cost_model.py --base-tools 5 --base-ops 5 --add-tools 300
+"""
+from __future__ import annotations
+import json
+import os
+import sys
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_mcp_server import generate_tool_catalog
+from traditional_mcp import run_traditional_simulation, TRAVEL_OPERATIONS
+from code_execution import run_code_execution_simulation
+
+CALIBRATION_TOOLS = (5, 10, 20, 50, 100, 200, 500)
+CODE_CALIBRATION_OPS = (1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _operations(m: int) -> list[dict]:
+    return [TRAVEL_OPERATIONS[i % len(TRAVEL_OPERATIONS)] for i in range(m)]
+
+
+def _fit_line(xs, ys) -> tuple[float, float]:
+    slope, intercept = np.polyfit(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float), 1)
+    return float(intercept), float(slope)
+
+
+@dataclass
+class CostModel:
+    """Linear token cost coefficients for both paradigms."""
+    initial_base: float = 0.0        # Traditional initial context with no tools
+    initial_per_tool: float = 0.0    # Schema + discovery tokens per tool
+    reload_base: float = 0.0         # Per-operation context reload with no tools
+    reload_per_tool: float = 0.0     # Per-operation context reload per tool
+    call_envelope: float = 0.0       # Reasoning + request tokens per call
+    response: float = 0.0            # Response tokens per call at R = 1
+    code_base: float = 0.0           # Code execution fixed cost
+    code_per_tool: float = 0.0       # Code execution discovery cost per catalog tool
+    code_per_schema: float = 0.0     # Code execution cost per distinct tool loaded (min(M, operation cycle))
+    code_per_op: float = 0.0         # Code execution cost per operation
+
+    @classmethod
+    def calibrate(cls, tool_counts=CALIBRATION_TOOLS,
+                  code_op_counts=CODE_CALIBRATION_OPS) -> CostModel:
+        """Fit coefficients from real simulation runs."""
+        initial, reload = [], []
+        for n in tool_counts:
+            acc = run_traditional_simulation(_operations(1), generate_tool_catalog(n))
+            initial.append(acc.initial_context_tokens)
+            reload.append(acc.total_context_tokens - acc.initial_context_tokens)
+        per_call = run_traditional_simulation(_operations(len(TRAVEL_OPERATIONS)))
+        # Code execution is fitted on N and M jointly: catalog listing plus batched operations
+        code_points = [(n, m) for n in tool_counts for m in code_op_counts]
+        code_totals = [run_code_execution_simulation(_operations(m), tools=generate_tool_catalog(n)).grand_total
+                       for n, m in code_points]
+        model = cls()
+        model.initial_base, model.initial_per_tool = _fit_line(tool_counts, initial)
+        model.reload_base, model.reload_per_tool = _fit_line(tool_counts, reload)
+        model.call_envelope = (per_call.total_reasoning_tokens + per_call.total_tool_call_tokens) / per_call.operation_count
+        model.response = per_call.total_response_tokens / per_call.operation_count
+        design = np.array([[1.0, n, min(m, len(TRAVEL_OPERATIONS)), m] for n, m in code_points])
+        coefficients = np.linalg.lstsq(design, np.asarray(code_totals, dtype=float), rcond=None)[0]
+        model.code_base, model.code_per_tool, model.code_per_schema, model.code_per_op = (float(c) for c in coefficients)
+        return model
+
+    def evaluate(self, n_tools, n_ops, response_scale=1.0) -> dict:
+        """Token totals for every (N, M, R) combination, shaped (len(N), len(M), len(R))."""
+        n = np.asarray(n_tools, dtype=float).reshape(-1, 1, 1)
+        m = np.asarray(n_ops, dtype=float).reshape(1, -1, 1)
+        r = np.asarray(response_scale, dtype=float).reshape(1, 1, -1)
+        traditional = (self.initial_base + self.initial_per_tool * n
+                       + m * (self.reload_base + self.reload_per_tool * n + self.call_envelope + self.response * r))
+        # Only the aggregated summary reaches the model, so code execution does not scale with R
+        code_execution = np.broadcast_to(self.code_base + self.code_per_tool * n
+                                         + self.code_per_schema * np.minimum(m, len(TRAVEL_OPERATIONS))
+                                         + self.code_per_op * m, traditional.shape)
+        savings = np.where(traditional > 0, (traditional - code_execution) / traditional * 100, 0.0)
+        return {"traditional": traditional, "code_execution": code_execution, "savings_percentage": savings}
+
+    def what_if(self, base_tools: int, base_ops: int, add_tools: int = 0, add_ops: int = 0,
+                response_scale: float = 1.0) -> dict:
+        """Traditional / code-execution totals before and after growing the catalog or workload."""
+        grid = self.evaluate([base_tools, base_tools + add_tools], [base_ops, base_ops + add_ops], [1.0, response_scale])
+        before = {k: round(float(v[0, 0, 0]), 1) for k, v in grid.items()}
+        after = {k: round(float(v[1, 1, 1]), 1) for k, v in grid.items()}
+        return {"before": before, "after": after,
+                "traditional_delta": round(after["traditional"] - before["traditional"], 1),
+                "code_execution_delta": round(after["code_execution"] - before["code_execution"], 1)}
+
+    def validate(self, n_tools, n_ops, samples: int = 10, seed: int = 0) -> dict:
+        """Compare model predictions with full simulations at sampled (N, M) points (R = 1)."""
+        rng = np.random.default_rng(seed)
+        points = [(int(rng.choice(n_tools)), int(rng.choice(n_ops))) for _ in range(samples)]
+        rows = []
+        for n, m in points:
+            ops = _operations(m)
+            exact_trad = run_traditional_simulation(ops, generate_tool_catalog(n)).grand_total
+            exact_code = run_code_execution_simulation(ops, tools=generate_tool_catalog(n)).grand_total
+            predicted = self.evaluate([n], [m])
+            pred_trad, pred_code = float(predicted["traditional"].item()), float(predicted["code_execution"].item())
+            rows.append({"n_tools": n, "n_operations": m,
+                         "traditional_error_pct": round((pred_trad - exact_trad) / exact_trad * 100, 3),
+                         "code_execution_error_pct": round((pred_code - exact_code) / exact_code * 100, 3)})
+        worst = max((max(abs(r["traditional_error_pct"]), abs(r["code_execution_error_pct"])) for r in rows), default=0.0)
+        return {"samples": rows, "max_abs_error_pct": worst}
+
+    def to_dict(self) -> dict:
+        return {k: round(v, 4) for k, v in asdict(self).items()}
+
+
+def parse_axis(value: str) -> np.ndarray:
+    """'a,b,c' for explicit values or 'start:stop:count' for a log-spaced integer range."""
+    if ":" in value:
+        start, stop, count = (float(v) for v in value.split(":"))
+        return np.unique(np.geomspace(start, stop, int(count)).round().astype(int))
+    return np.array([int(v) for v in value.split(",") if v.strip()])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analytical what-if token model for MCP paradigms")
+    parser.add_argument("--tools", type=parse_axis, default=parse_axis("5:5000:40"), help="N axis")
+    parser.add_argument("--ops", type=parse_axis, default=parse_axis("1:1000:40"), help="M axis")
+    parser.add_argument("--response-scale", default="1", help="Comma-separated response size multipliers (R)")
+    parser.add_argument("--validate", type=int, default=0, help="Check this many sampled grid points against simulations")
+    parser.add_argument("--base-tools", type=int, help="What-if baseline N")
+    parser.add_argument("--base-ops", type=int, default=5, help="What-if baseline M")
+    parser.add_argument("--add-tools", type=int, default=0)
+    parser.add_argument("--add-ops", type=int, default=0)
+    parser.add_argument("--output", help="Save the evaluated grid to this .npz file")
+
+    args = parser.parse_args()
+
+    model = CostModel.calibrate()
+    print(f"Calibrated coefficients: {json.dumps(model.to_dict())}")
+
+    if args.base_tools is not None:
+        scale = float(args.response_scale.split(",")[0])
+        print(json.dumps(model.what_if(args.base_tools, args.base_ops, args.add_tools, args.add_ops, scale), indent=2))
+    else:
+        scales = [float(v) for v in args.response_scale.split(",")]
+        grid = model.evaluate(args.tools, args.ops, scales)
+        savings = grid["savings_percentage"]
+        print(f"Evaluated {savings.size:,} grid points "
+              f"(N {args.tools.min()}..{args.tools.max()}, M {args.ops.min()}..{args.ops.max()}, R {scales})")
+        print(f"Savings: min {savings.min():.2f}% | median {np.median(savings):.2f}% | max {savings.max():.2f}%")
+        if args.output:
+            np.savez_compressed(args.output, n_tools=args.tools, n_ops=args.ops, response_scale=scales, **grid)
+            print(f"[Grid saved: {args.output}]")
+
+    if args.validate:
+        print(json.dumps(model.validate(args.tools, args.ops, args.validate), indent=2))
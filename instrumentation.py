@@ -0,0 +1,153 @@
+"""
+Per-stage timing instrumentation for the simulations.
+
+Simulation code wraps its stages in `with stage("..."):`. While disabled,
+stage() returns one shared no-op context manager, so the hooks cost a
+global lookup and a function call. enable() turns on call counts with
+wall/CPU time per stage, and optionally cProfile and tracemalloc capture
+for the whole run.
+"""
+from __future__ import annotations
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Optional
+
+_NULL_STAGE = nullcontext()
+_enabled = False
+_stats: dict[str, StageStats] = {}
+_profiler = None
+_tracemalloc = False
+
+
+@dataclass
+class StageStats:
+    """Call count and inclusive wall/CPU time for one stage."""
+    calls: int = 0
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    allocated_bytes: int = 0  # Net traced allocation, only with tracemalloc
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "mean_wall_us": round(self.wall_seconds / self.calls * 1e6, 2) if self.calls else 0.0,
+            "allocated_bytes": self.allocated_bytes
+        }
+
+
+class _Stage:
+    __slots__ = ("name", "wall", "cpu", "mem")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        if _tracemalloc:
+            import tracemalloc
+            self.mem = tracemalloc.get_traced_memory()[0]
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        stats = _stats.get(self.name)
+        if stats is None:
+            stats = _stats[self.name] = StageStats()
+        stats.calls += 1
+        stats.wall_seconds += wall
+        stats.cpu_seconds += cpu
+        if _tracemalloc:
+            import tracemalloc
+            stats.allocated_bytes += tracemalloc.get_traced_memory()[0] - self.mem
+        return False
+
+
+def stage(name: str):
+    """Context manager timing one stage; a shared no-op while instrumentation is disabled."""
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(cprofile: bool = False, trace_memory: bool = False) -> None:
+    """Start collecting stage stats (and optionally cProfile / tracemalloc data)."""
+    global _enabled, _profiler, _tracemalloc
+    reset()
+    _enabled = True
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+        _tracemalloc = True
+    if cprofile:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def disable() -> None:
+    """Stop collecting; gathered stats stay available until reset()."""
+    global _enabled
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+
+
+def reset() -> None:
+    global _profiler, _tracemalloc
+    _stats.clear()
+    _profiler = None
+    if _tracemalloc:
+        import tracemalloc
+        tracemalloc.stop()
+        _tracemalloc = False
+
+
+def report(top: int = 20) -> dict:
+    """Machine-readable report: per-stage stats plus any cProfile / tracemalloc capture."""
+    out: dict = {"stages": {name: s.to_dict() for name, s in sorted(_stats.items())}}
+    if _profiler is not None:
+        import pstats
+        stats = pstats.Stats(_profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:top]
+        out["cprofile"] = [
+            {"function": f"{path}:{line}({func})", "ncalls": nc, "tottime": round(tt, 6), "cumtime": round(ct, 6)}
+            for (path, line, func), (cc, nc, tt, ct, _) in rows
+        ]
+    if _tracemalloc:
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().statistics("lineno")[:top]
+        out["tracemalloc"] = {
+            "current_bytes": current, "peak_bytes": peak,
+            "top_allocations": [{"site": str(s.traceback), "bytes": s.size, "count": s.count} for s in snapshot]
+        }
+    return out
+
+
+def print_report(data: Optional[dict] = None, top: int = 10) -> None:
+    """Print the per-stage table (and top cProfile / allocation entries if captured)."""
+    data = data or report()
+    print("\n" + "=" * 70)
+    print("STAGE PROFILE")
+    print("=" * 70)
+    print(f"{'Stage':<32} {'Calls':>8} {'Wall ms':>10} {'CPU ms':>10} {'Alloc KB':>9}")
+    for name, s in data["stages"].items():
+        print(f"{name:<32} {s['calls']:>8} {s['wall_seconds'] * 1000:>10.3f} "
+              f"{s['cpu_seconds'] * 1000:>10.3f} {s['allocated_bytes'] / 1024:>9.1f}")
+    if "cprofile" in data:
+        print(f"\nTop {top} functions by cumulative time:")
+        for row in data["cprofile"][:top]:
+            print(f"  {row['cumtime'] * 1000:9.3f} ms  {row['ncalls']:>7}  {row['function']}")
+    if "tracemalloc" in data:
+        mem = data["tracemalloc"]
+        print(f"\nPeak traced memory: {mem['peak_bytes'] / 1024:,.1f} KB")
+        for row in mem["top_allocations"][:top]:
+            print(f"  {row['bytes'] / 1024:9.1f} KB  {row['site']}")
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Asyncio JSON-RPC 2.0 transport for the mock MCP server.
+
+Serves tools/list and tools/call from TRAVEL_MCP_TOOLS / MOCK_RESPONSES as
+newline-delimited JSON over stdio, a Unix socket or TCP, with configurable
+per-tool latency and jitter. MCPClient keeps one connection open and
+multiplexes requests over it by id, so the traditional sequential
+round-trips and the code-execution batch can be timed end to end.
+
+Run with: python mcp_transport.py bench --latency 0.05 --jitter 0.01
+"""
+from __future__ import annotations
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_mcp_server import MCPTool, ToolRegistry, RESPONSE_CACHE, as_registry
+from wire_formats import WIRE_FORMATS, set_wire_format
+
+PARSE_ERROR, INVALID_REQUEST, METHOD_NOT_FOUND, INVALID_PARAMS, INTERNAL_ERROR = -32700, -32600, -32601, -32602, -32603
+STREAM_LIMIT = 64 * 1024 * 1024  # Allow large stress-run responses on one line
+
+# tools/call results are spliced around the cached escaped response text, never re-serialized
+_CALL_RESULT_PREFIX = b', "result": {"content": [{"type": "text", "text": '
+_CALL_RESULT_SUFFIX = b'}]}}\n'
+
+
+class MCPRPCError(Exception):
+    """JSON-RPC error returned by the server."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class MCPServer:
+    """JSON-RPC 2.0 server for the mock travel tools with latency injection."""
+
+    def __init__(self, tools: ToolRegistry | list[MCPTool] | None = None, latency: float = 0.0, jitter: float = 0.0,
+                 tool_latency: Optional[dict[str, float]] = None, seed: Optional[int] = None):
+        self.registry = as_registry(tools)
+        self.latency = latency
+        self.jitter = jitter
+        self.tool_latency = tool_latency or {}
+        self._rng = random.Random(seed)
+
+    def delay_for(self, tool_name: str) -> float:
+        """Injected service time for one call: per-tool (or default) latency ± uniform jitter."""
+        base = self.tool_latency.get(tool_name, self.latency)
+        return max(0.0, base + self._rng.uniform(-self.jitter, self.jitter)) if self.jitter else base
+
+    async def handle(self, message: dict) -> Optional[list]:
+        """Dispatch one request; returns the response line as byte buffers, or None for notifications."""
+        msg_id = message.get("id")
+        method = message.get("method")
+        try:
+            if message.get("jsonrpc") != "2.0" or not isinstance(method, str):
+                raise MCPRPCError(INVALID_REQUEST, "Invalid Request")
+            if method == "tools/list":
+                result = {"tools": [t.to_schema() for t in self.registry]}
+            elif method == "tools/call":
+                params = message.get("params", {})
+                name = params.get("name") if isinstance(params, dict) else None
+                if not isinstance(name, str):
+                    raise MCPRPCError(INVALID_PARAMS, "Invalid params: expected {\"name\": <tool name>}")
+                if name not in self.registry:
+                    raise MCPRPCError(INVALID_PARAMS, f"Unknown tool: {name}")
+                delay = self.delay_for(name)
+                if delay:
+                    await asyncio.sleep(delay)
+                if msg_id is None:
+                    return None
+                head = json.dumps({"jsonrpc": "2.0", "id": msg_id}).encode()[:-1]
+                return [head, _CALL_RESULT_PREFIX, RESPONSE_CACHE.escaped(name), _CALL_RESULT_SUFFIX]
+            else:
+                raise MCPRPCError(METHOD_NOT_FOUND, f"Method not found: {method}")
+        except Exception as e:
+            # Every request with an id gets a reply; anything unexpected is an internal error
+            if msg_id is None:
+                return None
+            code, text = (e.code, e.message) if isinstance(e, MCPRPCError) else (INTERNAL_ERROR, f"Internal error: {e}")
+            return [json.dumps({"jsonrpc": "2.0", "id": msg_id, "error": {"code": code, "message": text}},
+                               default=repr).encode() + b"\n"]
+        return None if msg_id is None else [json.dumps({"jsonrpc": "2.0", "id": msg_id, "result": result}).encode() + b"\n"]
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer) -> None:
+        """Serve one connection; requests run concurrently so pipelined calls overlap."""
+        write_lock = asyncio.Lock()
+        tasks: set[asyncio.Task] = set()
+
+        async def respond(message: dict) -> None:
+            buffers = await self.handle(message)
+            if buffers is not None:
+                async with write_lock:
+                    writer.writelines(buffers)
+                    await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    error = {"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": "Parse error"}}
+                    async with write_lock:
+                        writer.write(json.dumps(error).encode() + b"\n")
+                        await writer.drain()
+                    continue
+                task = asyncio.create_task(respond(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.serve_connection, host, port, limit=STREAM_LIMIT)
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        return await asyncio.start_unix_server(self.serve_connection, path, limit=STREAM_LIMIT)
+
+    async def serve_stdio(self) -> None:
+        """Serve a single session over this process's stdin/stdout."""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        await self.serve_connection(reader, writer)
+
+
+class MCPClient:
+    """Async JSON-RPC client that reuses one connection for all requests."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader, self._writer = reader, writer
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @classmethod
+    async def connect_tcp(cls, host: str, port: int) -> MCPClient:
+        return cls(*await asyncio.open_connection(host, port, limit=STREAM_LIMIT))
+
+    @classmethod
+    async def connect_unix(cls, path: str) -> MCPClient:
+        return cls(*await asyncio.open_unix_connection(path, limit=STREAM_LIMIT))
+
+    async def _read_responses(self) -> None:
+        try:
+            while line := await self._reader.readline():
+                message = json.loads(line)
+                future = self._pending.pop(message.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(MCPRPCError(message["error"]["code"], message["error"]["message"]))
+                else:
+                    future.set_result(message.get("result"))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP connection closed"))
+            self._pending.clear()
+
+    async def request(self, method: str, params: Optional[dict] = None):
+        """Send one request and await its result."""
+        msg_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[msg_id] = future
+        message = {"jsonrpc": "2.0", "id": msg_id, "method": method, "params": params or {}}
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def list_tools(self) -> list[dict]:
+        return (await self.request("tools/list"))["tools"]
+
+    async def call_tool(self, name: str, arguments: dict) -> dict:
+        return await self.request("tools/call", {"name": name, "arguments": arguments})
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._reader_task.cancel()
+
+
+async def time_traditional(client: MCPClient, operations: list[dict]) -> float:
+    """Discovery plus one sequential round-trip per operation; returns elapsed seconds."""
+    start = time.perf_counter()
+    await client.list_tools()
+    for op in operations:
+        await client.call_tool(op["tool"], op["args"])
+    return time.perf_counter() - start
+
+
+async def time_code_execution(client: MCPClient, operations: list[dict]) -> float:
+    """All operations issued as one concurrent batch; returns elapsed seconds."""
+    start = time.perf_counter()
+    await asyncio.gather(*(client.call_tool(op["tool"], op["args"]) for op in operations))
+    return time.perf_counter() - start
+
+
+async def run_latency_benchmark(operations: list[dict], server: MCPServer, unix_path: Optional[str] = None,
+                                repeats: int = 5) -> dict:
+    """Time both paradigms against an in-process server on localhost (TCP or Unix socket)."""
+    if unix_path:
+        listener = await server.start_unix(unix_path)
+        client = await MCPClient.connect_unix(unix_path)
+    else:
+        listener = await server.start_tcp()
+        client = await MCPClient.connect_tcp(*listener.sockets[0].getsockname()[:2])
+    try:
+        traditional = [await time_traditional(client, operations) for _ in range(repeats)]
+        code_execution = [await time_code_execution(client, operations) for _ in range(repeats)]
+    finally:
+        await client.close()
+        listener.close()
+        await listener.wait_closed()
+    trad_ms, code_ms = sorted(traditional)[len(traditional) // 2] * 1000, sorted(code_execution)[len(code_execution) // 2] * 1000
+    return {
+        "transport": "unix" if unix_path else "tcp", "operations": len(operations), "repeats": repeats,
+        "traditional_ms": round(trad_ms, 2), "code_execution_ms": round(code_ms, 2),
+        "speedup": round(trad_ms / code_ms, 2) if code_ms > 0 else 0
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from traditional_mcp import TRAVEL_OPERATIONS
+
+    parser = argparse.ArgumentParser(description="Mock MCP JSON-RPC server and latency benchmark")
+    parser.add_argument("mode", choices=["serve", "bench"])
+    parser.add_argument("--stdio", action="store_true", help="Serve over stdin/stdout")
+    parser.add_argument("--unix", help="Unix socket path")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Per-call latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform ± jitter in seconds")
+    parser.add_argument("--tool-latency", default="", help="Per-tool overrides, e.g. search_flights=0.2,check_weather=0.05")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--wire-format", choices=sorted(WIRE_FORMATS), default="json",
+                        help="Encoding of tools/call result text")
+
+    args = parser.parse_args()
+    set_wire_format(args.wire_format)
+
+    overrides = dict(item.split("=", 1) for item in args.tool_latency.split(",") if item)
+    server = MCPServer(latency=args.latency, jitter=args.jitter, seed=args.seed,
+                       tool_latency={name: float(v) for name, v in overrides.items()})
+
+    async def serve() -> None:
+        if args.stdio:
+            await server.serve_stdio()
+            return
+        listener = await (server.start_unix(args.unix) if args.unix else server.start_tcp(args.host, args.port))
+        print(f"[Serving MCP JSON-RPC on {args.unix or f'{args.host}:{args.port}'}]", file=sys.stderr)
+        async with listener:
+            await listener.serve_forever()
+
+    if args.mode == "serve":
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(run_latency_benchmark(TRAVEL_OPERATIONS, server, args.unix, args.repeats)), indent=2))
@@ -1,7 +1,13 @@
 """Mock MCP Server with travel planning tools following MCP spec."""
 from __future__ import annotations
 import json
+import random
+from bisect import bisect_left
 from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from token_counter import count_tokens, encoding_epoch
+from wire_formats import JSON_INDENT, get_wire_format, wire_format_epoch
 
 @dataclass
 class MCPTool:
@@ -9,6 +15,11 @@ class MCPTool:
     name: str
     description: str
     input_schema: dict
+    namespace: str = ""  # Capability namespace, e.g. "travel" (not part of the MCP schema)
+    
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.namespace}.{self.name}" if self.namespace else self.name
     
     def to_schema(self) -> dict:
         return {"name": self.name, "description": self.description, "inputSchema": self.input_schema}
@@ -21,29 +32,29 @@ TRAVEL_MCP_TOOLS = [
                        "departure_date": {"type": "string", "format": "date"},
                        "return_date": {"type": "string"}, "passengers": {"type": "integer", "default": 1},
                        "cabin_class": {"type": "string", "enum": ["economy", "business", "first"]},
-                       "max_stops": {"type": "integer"}, "sort_by": {"type": "string"}}}),
+                       "max_stops": {"type": "integer"}, "sort_by": {"type": "string"}}}, "travel"),
     MCPTool("check_weather", "Get current weather and forecast for a location.",
         {"type": "object", "required": ["location"],
          "properties": {"location": {"type": "string"}, "units": {"type": "string", "enum": ["metric", "imperial"]},
-                       "include_forecast": {"type": "boolean"}, "include_hourly": {"type": "boolean"}}}),
+                       "include_forecast": {"type": "boolean"}, "include_hourly": {"type": "boolean"}}}, "info"),
     MCPTool("search_hotels", "Search for available hotels in a destination.",
         {"type": "object", "required": ["destination", "check_in", "check_out"],
          "properties": {"destination": {"type": "string"}, "check_in": {"type": "string"},
                        "check_out": {"type": "string"}, "guests": {"type": "integer"},
                        "min_stars": {"type": "integer"}, "max_price": {"type": "number"},
-                       "amenities": {"type": "array", "items": {"type": "string"}}}}),
+                       "amenities": {"type": "array", "items": {"type": "string"}}}}, "travel"),
     MCPTool("check_calendar", "Check calendar availability for date ranges.",
         {"type": "object", "required": ["start_date", "end_date"],
          "properties": {"start_date": {"type": "string"}, "end_date": {"type": "string"},
                        "calendars": {"type": "array"}, "timezone": {"type": "string"},
-                       "min_duration_minutes": {"type": "integer"}}}),
+                       "min_duration_minutes": {"type": "integer"}}}, "calendar"),
     MCPTool("create_booking", "Create a booking for flight, hotel, or travel package.",
         {"type": "object", "required": ["booking_type", "item_id", "passengers", "contact_email", "payment_method"],
          "properties": {"booking_type": {"type": "string", "enum": ["flight", "hotel", "package"]},
                        "item_id": {"type": "string"},
                        "passengers": {"type": "array", "items": {"type": "object"}},
                        "contact_email": {"type": "string"}, "payment_method": {"type": "string"},
-                       "special_requests": {"type": "string"}, "add_to_calendar": {"type": "boolean"}}})
+                       "special_requests": {"type": "string"}, "add_to_calendar": {"type": "boolean"}}}, "travel")
 ]
 
 # Mock responses for each tool
@@ -65,17 +76,339 @@ MOCK_RESPONSES = {
     "create_booking": {"booking_id": "BK-2024-12345", "status": "confirmed", "total_amount": 835.00}
 }
 
-def get_all_tools_json() -> str:
+class ToolRegistry:
+    """Indexed MCP tool registry with cached schema text and token counts.
+    
+    Name lookups are O(1); namespace queries ("travel.*") use a dotted-namespace
+    index and prefix queries bisect a sorted list of qualified names. Serialized
+    schemas, token counts and whole-catalog text are cached and invalidated on
+    every registration change.
+    """
+    
+    def __init__(self, tools: Iterable[MCPTool] = ()):
+        self._tools: dict[str, MCPTool] = {}
+        self._namespaces: dict[str, dict[str, None]] = {}  # namespace (and parents) -> ordered names
+        self._sorted: list[tuple[str, str]] | None = None  # (qualified name, name), rebuilt lazily
+        self._schema_json: dict[str, str] = {}
+        self._schema_tokens: dict[str, int] = {}
+        self._memo: dict = {}
+        self._epoch = None  # (encoding, wire format) epochs the cached text and counts belong to
+        self.version = 0
+        for tool in tools:
+            self.register(tool)
+    
+    def __len__(self) -> int:
+        return len(self._tools)
+    
+    def __contains__(self, name: object) -> bool:
+        return name in self._tools
+    
+    def __iter__(self) -> Iterator[MCPTool]:
+        return iter(self._tools.values())
+    
+    @staticmethod
+    def _namespace_chain(namespace: str) -> list[str]:
+        parts = namespace.split(".") if namespace else []
+        return [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    
+    def _check_epoch(self) -> None:
+        # Schema text, token counts and values built from them depend on the active format and encodings
+        epoch = (encoding_epoch(), wire_format_epoch())
+        if epoch != self._epoch:
+            self._schema_json.clear()
+            self._schema_tokens.clear()
+            self._memo.clear()
+            self._epoch = epoch
+    
+    def _changed(self, name: str) -> None:
+        self._schema_json.pop(name, None)
+        self._schema_tokens.pop(name, None)
+        self._memo.clear()
+        self._sorted = None
+        self.version += 1
+    
+    def register(self, tool: MCPTool) -> None:
+        """Add a tool, replacing any existing tool with the same name."""
+        if tool.name in self._tools:
+            self.unregister(tool.name)
+        self._tools[tool.name] = tool
+        for ns in self._namespace_chain(tool.namespace):
+            self._namespaces.setdefault(ns, {})[tool.name] = None
+        self._changed(tool.name)
+    
+    def unregister(self, name: str) -> MCPTool | None:
+        """Remove a tool by name, returning it (or None if absent)."""
+        tool = self._tools.pop(name, None)
+        if tool is None:
+            return None
+        for ns in self._namespace_chain(tool.namespace):
+            members = self._namespaces[ns]
+            members.pop(name, None)
+            if not members:
+                del self._namespaces[ns]
+        self._changed(name)
+        return tool
+    
+    def get(self, name: str) -> MCPTool | None:
+        return self._tools.get(name)
+    
+    def by_namespace(self, namespace: str) -> list[MCPTool]:
+        """Tools in a namespace or any of its sub-namespaces."""
+        return [self._tools[n] for n in self._namespaces.get(namespace, ())]
+    
+    def with_prefix(self, prefix: str) -> list[MCPTool]:
+        """Tools whose qualified name starts with prefix, in sorted order."""
+        if self._sorted is None:
+            self._sorted = sorted((t.qualified_name, t.name) for t in self._tools.values())
+        out = []
+        for qualified, name in self._sorted[bisect_left(self._sorted, (prefix, "")):]:
+            if not qualified.startswith(prefix):
+                break
+            out.append(self._tools[name])
+        return out
+    
+    def match(self, pattern: str) -> list[MCPTool]:
+        """Resolve "ns.*" to a namespace, "prefix*" to a prefix query, else an exact name."""
+        if pattern.endswith(".*"):
+            return self.by_namespace(pattern[:-2])
+        if pattern.endswith("*"):
+            return self.with_prefix(pattern[:-1])
+        tool = self._tools.get(pattern)
+        return [tool] if tool else [t for t in self.with_prefix(pattern) if t.qualified_name == pattern]
+    
+    def schema_json(self, name: str) -> str:
+        """Cached text of one tool's schema in the active wire format (indented JSON by default)."""
+        self._check_epoch()
+        text = self._schema_json.get(name)
+        if text is None:
+            text = self._schema_json[name] = get_wire_format().encode(self._tools[name].to_schema())
+        return text
+    
+    def schema_tokens(self, name: str) -> int:
+        """Cached token count of one tool's schema."""
+        self._check_epoch()
+        n = self._schema_tokens.get(name)
+        if n is None:
+            n = self._schema_tokens[name] = count_tokens(self.schema_json(name))
+        return n
+    
+    def tools_json(self, depth: int = 0) -> str:
+        """The catalog as an indent=2 JSON array nested `depth` levels deep, built from cached schemas.
+        
+        Other wire formats encode the whole schema list at once (depth does not apply).
+        """
+        def build() -> str:
+            fmt = get_wire_format()
+            if fmt is not JSON_INDENT:
+                return fmt.encode([t.to_schema() for t in self._tools.values()])
+            if not self._tools:
+                return "[]"
+            pad, item_pad = "  " * depth, "  " * (depth + 1)
+            items = (item_pad + self.schema_json(n).replace("\n", "\n" + item_pad) for n in self._tools)
+            return "[\n" + ",\n".join(items) + "\n" + pad + "]"
+        return self.memo(("tools_json", depth), build)
+    
+    def memo(self, key, factory: Callable[[], object]):
+        """Cache a value derived from the current catalog until the next change."""
+        self._check_epoch()
+        if key not in self._memo:
+            self._memo[key] = factory()
+        return self._memo[key]
+
+def as_registry(tools: ToolRegistry | Iterable[MCPTool] | None = None) -> ToolRegistry:
+    """Normalize a tool source; None means the travel tool registry."""
+    if tools is None:
+        return TRAVEL_REGISTRY
+    return tools if isinstance(tools, ToolRegistry) else ToolRegistry(tools)
+
+TRAVEL_REGISTRY = ToolRegistry(TRAVEL_MCP_TOOLS)
+
+def generate_tool_catalog(n: int) -> list[MCPTool]:
+    """Build a synthetic catalog of n tools by cloning the travel tools."""
+    catalog = list(TRAVEL_MCP_TOOLS[:n])
+    for i in range(len(catalog), n):
+        base = TRAVEL_MCP_TOOLS[i % len(TRAVEL_MCP_TOOLS)]
+        catalog.append(MCPTool(f"{base.name}_{i}", f"{base.description} (variant {i})", base.input_schema,
+                               base.namespace))
+    return catalog
+
+def get_all_tools_json(tools: ToolRegistry | Iterable[MCPTool] | None = None) -> str:
     """Get JSON string of all tool definitions for token counting."""
-    return json.dumps([t.to_schema() for t in TRAVEL_MCP_TOOLS], indent=2)
+    return as_registry(tools).tools_json()
 
 def get_tool_by_name(name: str) -> MCPTool | None:
     """Get a specific tool by name."""
-    return next((t for t in TRAVEL_MCP_TOOLS if t.name == name), None)
+    return TRAVEL_REGISTRY.get(name)
+
+# Fixed bytes around the escaped response text in the indent=2 tools/call result envelope:
+# json.dumps({"result": {"content": [{"text": text}]}}, indent=2)
+ENVELOPE_PREFIX = b'{\n  "result": {\n    "content": [\n      {\n        "text": '
+ENVELOPE_SUFFIX = b'\n      }\n    ]\n  }\n}'
+_envelope_parts: dict = {}
+
+def result_envelope() -> tuple[bytes, bytes]:
+    """Bytes around the escaped response text in the active wire format's tools/call result envelope."""
+    fmt = get_wire_format()
+    if fmt is JSON_INDENT:
+        return ENVELOPE_PREFIX, ENVELOPE_SUFFIX
+    parts = _envelope_parts.get(fmt)
+    if parts is None:
+        prefix, suffix = fmt.wrap({"result": {"content": [{"text": "\x00"}]}})
+        parts = _envelope_parts[fmt] = (prefix.encode(), suffix.encode())
+    return parts
+
+class ResponseCache:
+    """Pre-encoded mock responses handed out as memoryviews.
+    
+    Each response is serialized once in the active wire format (indent=2 JSON
+    by default), plus its escaped form as a JSON string literal for splicing
+    into envelopes; a format change drops every entry. Entries of at
+    least `mmap_threshold` bytes are opt-in served from an anonymous
+    memory-mapped temp file instead of the heap.
+    """
+    
+    def __init__(self, responses: dict | None = None, mmap_threshold: int | None = None):
+        self.responses = MOCK_RESPONSES if responses is None else responses
+        self.mmap_threshold = mmap_threshold
+        self._raw: dict[str, memoryview] = {}
+        self._escaped: dict[str, memoryview] = {}
+        self._envelopes: dict[str, memoryview] = {}
+        self._envelope_tokens: dict[str, int] = {}
+        self._epoch = -1
+        self._format_epoch = wire_format_epoch()
+        self._mapped: dict[str, list] = {}  # name -> open files/mmaps backing its views
+    
+    def _buffer(self, name: str, data: bytes) -> memoryview:
+        if self.mmap_threshold is None or len(data) < self.mmap_threshold:
+            return memoryview(data)
+        import mmap
+        import tempfile
+        f = tempfile.TemporaryFile()
+        f.write(data)
+        f.flush()
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapped.setdefault(name, []).extend([mm, f])
+        return memoryview(mm)
+    
+    def _check_format(self) -> None:
+        if self._format_epoch != wire_format_epoch():
+            self.invalidate()
+            self._format_epoch = wire_format_epoch()
+    
+    def _encode(self, name: str) -> None:
+        text = get_wire_format().encode(self.responses.get(name, {"status": "success"}))
+        self._raw[name] = self._buffer(name, text.encode())
+        self._escaped[name] = self._buffer(name, json.dumps(text).encode())
+    
+    def raw(self, name: str) -> memoryview:
+        """The response as encoded bytes (indent=2 JSON by default)."""
+        self._check_format()
+        if name not in self._raw:
+            self._encode(name)
+        return self._raw[name]
+    
+    def escaped(self, name: str) -> memoryview:
+        """The encoded response as an escaped JSON string literal (quotes included)."""
+        self._check_format()
+        if name not in self._escaped:
+            self._encode(name)
+        return self._escaped[name]
+    
+    def envelope(self, name: str) -> memoryview:
+        """The tools/call result envelope (indent=2 by default), spliced around the escaped response."""
+        self._check_format()
+        view = self._envelopes.get(name)
+        if view is None:
+            prefix, suffix = result_envelope()
+            view = self._envelopes[name] = self._buffer(name, splice(prefix, self.escaped(name), suffix))
+        return view
+    
+    def envelope_tokens(self, name: str) -> int:
+        """Token count of envelope(name), counted once per response."""
+        self._check_format()
+        if self._epoch != encoding_epoch():
+            self._envelope_tokens.clear()
+            self._epoch = encoding_epoch()
+        n = self._envelope_tokens.get(name)
+        if n is None:
+            n = self._envelope_tokens[name] = count_tokens(str(self.envelope(name), "utf-8"))
+        return n
+    
+    def invalidate(self, name: str | None = None) -> None:
+        """Drop cached encodings for one response (or all of them)."""
+        names = list(self._raw.keys() | self._envelopes.keys()) if name is None else [name]
+        for n in names:
+            self._raw.pop(n, None)
+            self._escaped.pop(n, None)
+            self._envelopes.pop(n, None)
+            self._envelope_tokens.pop(n, None)
+            # Mappings close once the last outstanding memoryview is released
+            self._mapped.pop(n, None)
+
+def splice(*buffers) -> bytes:
+    """Concatenate byte buffers (bytes or memoryviews) with a single copy."""
+    return b"".join(buffers)
+
+RESPONSE_CACHE = ResponseCache()
+
+def configure_response_cache(mmap_threshold: int | None = None) -> ResponseCache:
+    """Reconfigure the shared response cache, e.g. to serve large responses from mmap."""
+    RESPONSE_CACHE.invalidate()
+    RESPONSE_CACHE.mmap_threshold = mmap_threshold
+    return RESPONSE_CACHE
+
+def register_response(tool_name: str, payload: dict) -> None:
+    """Set the mock response for a tool and drop its cached encodings."""
+    MOCK_RESPONSES[tool_name] = payload
+    RESPONSE_CACHE.invalidate(tool_name)
+
+# Large-response generator: tool -> (list field in the response, row factory(rng, i))
+_AIRLINES = ("American Airlines", "United Airlines", "Delta", "Air France", "Lufthansa", "KLM", "JetBlue", "British Airways")
+_HOTEL_WORDS = (("Grand", "Boutique", "Royal", "Little", "Central", "Riverside"),
+                ("Hotel Paris", "Montmartre", "Opera Suites", "Marais Inn", "Bastille Lodge", "Louvre Residence"))
+LARGE_RESPONSE_ROWS = {
+    "search_flights": ("flights", lambda rng, i: {
+        "id": f"FL-{i:06d}", "airline": rng.choice(_AIRLINES), "price": round(rng.uniform(80, 2500), 2),
+        "stops": rng.choice((0, 0, 1, 1, 2)), "duration_minutes": rng.randint(60, 1200)}),
+    "search_hotels": ("hotels", lambda rng, i: {
+        "id": f"HTL-{i:06d}", "name": f"{rng.choice(_HOTEL_WORDS[0])} {rng.choice(_HOTEL_WORDS[1])}",
+        "stars": rng.randint(1, 5), "rating": round(rng.uniform(5, 10), 1),
+        "price_per_night": round(rng.uniform(40, 900), 2)}),
+}
+
+def iter_response_rows(tool_name: str, rows: int, seed: int = 0) -> Iterator[dict]:
+    """Yield `rows` deterministic result rows for a list-returning tool, one at a time."""
+    if tool_name not in LARGE_RESPONSE_ROWS:
+        raise KeyError(f"no large-response generator for {tool_name!r} (have {sorted(LARGE_RESPONSE_ROWS)})")
+    rng, make_row = random.Random(seed), LARGE_RESPONSE_ROWS[tool_name][1]
+    for i in range(rows):
+        yield make_row(rng, i)
+
+def generate_large_response(tool_name: str, rows: int, seed: int = 0) -> dict:
+    """A fully materialized response shaped like MOCK_RESPONSES[tool_name], with `rows` results."""
+    return {LARGE_RESPONSE_ROWS[tool_name][0]: list(iter_response_rows(tool_name, rows, seed)), "total_results": rows}
+
+def iter_large_response_json(tool_name: str, rows: int, seed: int = 0) -> Iterator[str]:
+    """Text chunks of json.dumps(generate_large_response(...), indent=2), one row at a time."""
+    key = LARGE_RESPONSE_ROWS[tool_name][0]
+    yield f'{{\n  "{key}": ['
+    sep = "\n    "
+    for row in iter_response_rows(tool_name, rows, seed):
+        yield sep + json.dumps(row, indent=2).replace("\n", "\n    ")
+        sep = ",\n    "
+    yield ("\n  ]" if rows else "]") + f',\n  "total_results": {rows}\n}}'
+
+def register_large_response(tool_name: str, rows: int, seed: int = 0) -> None:
+    """Serve a generated `rows`-result response for a tool (from both the cache and the transport)."""
+    register_response(tool_name, generate_large_response(tool_name, rows, seed))
 
 def get_mock_response(tool_name: str) -> str:
-    """Get mock response JSON for a tool."""
-    return json.dumps(MOCK_RESPONSES.get(tool_name, {"status": "success"}), indent=2)
+    """Get the mock response text for a tool (JSON unless another wire format is active)."""
+    return str(RESPONSE_CACHE.raw(tool_name), "utf-8")
+
+def get_mock_response_bytes(tool_name: str) -> memoryview:
+    """Get the pre-encoded mock response JSON for a tool without copying."""
+    return RESPONSE_CACHE.raw(tool_name)
 
 if __name__ == "__main__":
     print(f"Tools: {len(TRAVEL_MCP_TOOLS)}")
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Prompt-cache-aware context cost and latency model.
+
+run_traditional_simulation charges a flat context reload per operation.
+Serving stacks instead re-read the whole, growing conversation prefix on
+every model call and reuse the KV state of prefixes they have seen
+recently. This module replays each paradigm's conversation turn by turn
+against a prefix cache with a TTL, a token capacity and an eviction
+policy, across one or more staggered sessions that share the system
+prompt and tool definitions. It reports cached vs uncached input tokens,
+the price-weighted effective input tokens and time-to-first-token (TTFT).
+
+Only prompt prefixes are written to the cache (as with API prompt
+caching); a turn's output becomes cacheable once it is part of the next
+prompt.
+
+Run with: python prompt_cache.py --sessions 20 --interval 30 --ttl 300
+          python prompt_cache.py --tools 500 --capacity 200000 --policy lfu
+"""
+from __future__ import annotations
+import heapq
+import json
+import os
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Iterable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import count_tokens
+from mock_mcp_server import MCPTool, ToolRegistry, as_registry
+
+POLICIES = ("lru", "fifo", "lfu")
+
+
+@dataclass
+class Turn:
+    """One model call: segments appended to the prompt before it, and the tokens it generates."""
+    segments: list[tuple[str, int]]  # (label, tokens); labels prefixed "shared:" are identical across sessions
+    output_tokens: int
+
+
+@dataclass
+class PromptCacheConfig:
+    """Prefix cache behaviour and pricing (costs are relative to one uncached input token)."""
+    capacity_tokens: int = 1_000_000
+    ttl_seconds: float = 300.0       # Idle time after which an entry expires; hits refresh it
+    policy: str = "lru"              # Eviction order when over capacity: lru, fifo or lfu
+    read_cost: float = 0.1           # Price of a cached input token
+    write_cost: float = 1.0          # Price of an uncached input token written to the cache
+
+
+@dataclass
+class LatencyConfig:
+    """Simple serving-time model used to advance the simulated clock."""
+    base_seconds: float = 0.2                # Fixed per-request overhead before prefill
+    prefill_tokens_per_second: float = 5_000.0
+    cached_tokens_per_second: float = 100_000.0  # Loading reused KV state
+    decode_tokens_per_second: float = 50.0
+    tool_seconds: float = 0.5                # Tool execution between turns
+
+    def ttft(self, cached: int, uncached: int) -> float:
+        return (self.base_seconds + uncached / self.prefill_tokens_per_second
+                + cached / self.cached_tokens_per_second)
+
+
+class PrefixCache:
+    """KV prefix cache keyed by chained segment hashes, sized in tokens."""
+
+    def __init__(self, config: Optional[PromptCacheConfig] = None):
+        self.config = config or PromptCacheConfig()
+        if self.config.policy not in POLICIES:
+            raise ValueError(f"unknown eviction policy {self.config.policy!r} (expected one of {POLICIES})")
+        # key -> [tokens, last_used, hits]; ordered by insertion (fifo) or recency (lru)
+        self._entries: OrderedDict[int, list] = OrderedDict()
+        self._lfu_heap: list[tuple[int, float, int, int]] = []  # (hits, last_used, seq, key), stale entries skipped
+        self._seq = 0
+        self.used_tokens = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _touch(self, key: int, entry: list, now: float) -> None:
+        entry[1] = now
+        entry[2] += 1
+        if self.config.policy == "lru":
+            self._entries.move_to_end(key)
+        elif self.config.policy == "lfu":
+            self._seq += 1
+            heapq.heappush(self._lfu_heap, (entry[2], now, self._seq, key))
+            if len(self._lfu_heap) > 2 * len(self._entries) + 16:
+                self._compact_lfu_heap()
+
+    def _is_live(self, item: tuple[int, float, int, int]) -> bool:
+        entry = self._entries.get(item[3])
+        return entry is not None and entry[2] == item[0] and entry[1] == item[1]
+
+    def _compact_lfu_heap(self) -> None:
+        """Drop superseded heap items so the heap stays proportional to the live entries."""
+        self._lfu_heap = [item for item in self._lfu_heap if self._is_live(item)]
+        heapq.heapify(self._lfu_heap)
+
+    def _drop(self, key: int) -> None:
+        self.used_tokens -= self._entries.pop(key)[0]
+
+    def _evict_one(self) -> None:
+        if self.config.policy == "lfu":
+            while True:
+                item = heapq.heappop(self._lfu_heap)
+                if self._is_live(item):
+                    break
+            key = item[3]
+        else:
+            key = next(iter(self._entries))
+        self._drop(key)
+        self.evictions += 1
+
+    def lookup(self, keys: list[int], now: float) -> int:
+        """Number of leading keys whose prefix is cached and fresh (hits are refreshed)."""
+        for i, key in enumerate(keys):
+            entry = self._entries.get(key)
+            if entry is None:
+                return i
+            if now - entry[1] > self.config.ttl_seconds:
+                self._drop(key)
+                self.expirations += 1
+                return i
+            self._touch(key, entry, now)
+        return len(keys)
+
+    def insert(self, key: int, tokens: int, now: float) -> None:
+        """Store one segment's KV state; segments larger than the whole cache are not stored."""
+        if key in self._entries or tokens > self.config.capacity_tokens:
+            return
+        while self.used_tokens + tokens > self.config.capacity_tokens:
+            self._evict_one()
+        self._entries[key] = [tokens, now, 0]
+        self.used_tokens += tokens
+        self._touch(key, self._entries[key], now)
+
+
+@dataclass
+class PromptCacheReport:
+    """Input-token and latency totals for one paradigm under the prefix cache."""
+    paradigm: str
+    sessions: int = 0
+    turns: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    uncached_tokens: int = 0
+    output_tokens: int = 0
+    effective_input_tokens: float = 0.0
+    evictions: int = 0
+    expirations: int = 0
+    ttft_seconds: list[float] = field(default_factory=list, repr=False)
+
+    def to_dict(self) -> dict:
+        ttft = sorted(self.ttft_seconds)
+
+        def pct(p: float) -> float:
+            return round(ttft[min(len(ttft) - 1, int(p * len(ttft)))], 4) if ttft else 0.0
+        out = {k: v for k, v in asdict(self).items() if k != "ttft_seconds"}
+        out.update({
+            "effective_input_tokens": round(self.effective_input_tokens, 1),
+            "cache_hit_rate": round(self.cached_tokens / self.input_tokens * 100, 2) if self.input_tokens else 0.0,
+            "ttft_mean_seconds": round(sum(ttft) / len(ttft), 4) if ttft else 0.0,
+            "ttft_p50_seconds": pct(0.5), "ttft_p95_seconds": pct(0.95)
+        })
+        return out
+
+
+def traditional_turns(operations: list[dict],
+                      tools: ToolRegistry | Iterable[MCPTool] | None = None) -> list[Turn]:
+    """Traditional conversation: tool schemas + discovery, then one model call per tool call."""
+    from traditional_mcp import SYSTEM_PROMPT, build_tools_context, simulate_tool_discovery, simulate_tool_call
+    registry = as_registry(tools)
+    tools_context = registry.memo("tools_context", lambda: build_tools_context(registry))
+    initial = registry.memo("initial_context_tokens", lambda: count_tokens(SYSTEM_PROMPT + tools_context))
+    segments = [(f"shared:tools:{id(registry)}:{registry.version}", int(initial)),
+                (f"shared:discovery:{id(registry)}:{registry.version}", int(simulate_tool_discovery(registry)))]
+    turns = []
+    for i, op in enumerate(operations):
+        metrics = simulate_tool_call(op["tool"], op["args"])
+        turns.append(Turn(segments, int(metrics.reasoning_tokens) + int(metrics.tool_call_tokens)))
+        segments = [(f"response:{i}", int(metrics.response_tokens))]
+    turns.append(Turn(segments, 0))  # Final answer over the whole transcript
+    return turns
+
+
+def code_execution_turns(operations: list[dict],
+                         tools: ToolRegistry | Iterable[MCPTool] | None = None) -> list[Turn]:
+    """Code-execution conversation: capability manifest, then one model call per step of
+    run_code_execution_simulation over the same catalog (discovery, batched intent, each booking)."""
+    from code_execution import run_code_execution_simulation
+    acc = run_code_execution_simulation(operations, tools=as_registry(tools))
+    segments = [("shared:manifest", int(acc.initial_context_tokens))]
+    turns = []
+    for i, metrics in enumerate(acc.operations):
+        turns.append(Turn(segments, int(metrics.reasoning_tokens) + int(metrics.tool_call_tokens)))
+        segments = [(f"response:{i}", int(metrics.response_tokens))]
+    turns.append(Turn(segments, 0))
+    return turns
+
+
+def simulate_prompt_cache(paradigm: str, turns: list[Turn], sessions: int = 1, interval_seconds: float = 60.0,
+                          config: Optional[PromptCacheConfig] = None,
+                          latency: Optional[LatencyConfig] = None) -> PromptCacheReport:
+    """Replay `sessions` copies of a conversation, started interval_seconds apart, against one cache."""
+    cache, latency = PrefixCache(config), latency or LatencyConfig()
+    report = PromptCacheReport(paradigm, sessions=sessions)
+    # Each session's prompt is the concatenation of every segment so far; keys chain over that prefix
+    state = {s: ([], [], 0) for s in range(sessions)}  # session -> (keys, tokens per key, output tokens pending)
+    events = [(s * interval_seconds, s, 0) for s in range(sessions)]
+    heapq.heapify(events)
+    while events:
+        now, s, t = heapq.heappop(events)
+        keys, sizes, pending = state[s]
+        turn = turns[t]
+        new = [(f"output:{t - 1}", pending)] if t else []
+        for label, tokens in new + turn.segments:
+            parent = keys[-1] if keys else 0
+            keys.append(hash((parent, label if label.startswith("shared:") else (s, label))))
+            sizes.append(tokens)
+        hit = cache.lookup(keys, now)
+        cached = sum(sizes[:hit])
+        uncached = sum(sizes) - cached
+        for key, tokens in zip(keys[hit:], sizes[hit:]):
+            cache.insert(key, tokens, now)
+        ttft = latency.ttft(cached, uncached)
+        report.turns += 1
+        report.input_tokens += cached + uncached
+        report.cached_tokens += cached
+        report.uncached_tokens += uncached
+        report.output_tokens += turn.output_tokens
+        report.effective_input_tokens += cached * cache.config.read_cost + uncached * cache.config.write_cost
+        report.ttft_seconds.append(ttft)
+        state[s] = (keys, sizes, turn.output_tokens)
+        if t + 1 < len(turns):
+            done = now + ttft + turn.output_tokens / latency.decode_tokens_per_second + latency.tool_seconds
+            heapq.heappush(events, (done, s, t + 1))
+    report.evictions, report.expirations = cache.evictions, cache.expirations
+    return report
+
+
+def compare_prompt_cache(operations: list[dict], tools: ToolRegistry | Iterable[MCPTool] | None = None,
+                         sessions: int = 1, interval_seconds: float = 60.0,
+                         config: Optional[PromptCacheConfig] = None,
+                         latency: Optional[LatencyConfig] = None) -> dict:
+    """Prompt-cache reports for both paradigms (separate caches) and the effective savings."""
+    trad = simulate_prompt_cache("Traditional MCP", traditional_turns(operations, tools),
+                                 sessions, interval_seconds, config, latency).to_dict()
+    code = simulate_prompt_cache("Code Execution", code_execution_turns(operations, tools),
+                                 sessions, interval_seconds, config, latency).to_dict()
+    diff = trad["effective_input_tokens"] - code["effective_input_tokens"]
+    return {
+        "traditional": trad, "code_execution": code,
+        "effective_input_savings": round(diff, 1),
+        "effective_input_savings_percentage": (round(diff / trad["effective_input_tokens"] * 100, 2)
+                                               if trad["effective_input_tokens"] else 0.0)
+    }
+
+
+def print_prompt_cache_report(result: dict) -> None:
+    rows = [("Input tokens", "input_tokens"), ("  cached", "cached_tokens"), ("  uncached", "uncached_tokens"),
+            ("Cache hit rate %", "cache_hit_rate"), ("Effective input tokens", "effective_input_tokens"),
+            ("Output tokens", "output_tokens"), ("TTFT mean (s)", "ttft_mean_seconds"),
+            ("TTFT p95 (s)", "ttft_p95_seconds"), ("Evictions", "evictions"), ("Expirations", "expirations")]
+    trad, code = result["traditional"], result["code_execution"]
+    print("\n" + "=" * 70)
+    print(f"PROMPT CACHE MODEL ({trad['sessions']} session(s), {trad['turns']} vs {code['turns']} model calls)")
+    print("=" * 70)
+    print(f"{'Metric':<26} {'Traditional':>18} {'Code Execution':>18}")
+    for label, key in rows:
+        print(f"{label:<26} {trad[key]:>18,} {code[key]:>18,}")
+    print(f"\nEffective input savings: {result['effective_input_savings']:,} tokens "
+          f"({result['effective_input_savings_percentage']}%)")
+
+
+if __name__ == "__main__":
+    import argparse
+    from mock_mcp_server import generate_tool_catalog
+    from traditional_mcp import TRAVEL_OPERATIONS
+
+    parser = argparse.ArgumentParser(description="Prompt-cache-aware cost and TTFT model for both paradigms")
+    parser.add_argument("--tools", type=int, help="Synthetic catalog size (default: the 5 travel tools)")
+    parser.add_argument("--ops", type=int, default=len(TRAVEL_OPERATIONS), help="Operations per session")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between session starts")
+    parser.add_argument("--capacity", type=int, default=PromptCacheConfig.capacity_tokens, help="Cache size in tokens")
+    parser.add_argument("--ttl", type=float, default=PromptCacheConfig.ttl_seconds, help="Entry TTL in seconds")
+    parser.add_argument("--policy", choices=POLICIES, default=PromptCacheConfig.policy)
+    parser.add_argument("--read-cost", type=float, default=PromptCacheConfig.read_cost)
+    parser.add_argument("--write-cost", type=float, default=PromptCacheConfig.write_cost)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+
+    tools = generate_tool_catalog(args.tools) if args.tools else None
+    operations = [TRAVEL_OPERATIONS[i % len(TRAVEL_OPERATIONS)] for i in range(args.ops)]
+    config = PromptCacheConfig(args.capacity, args.ttl, args.policy, args.read_cost, args.write_cost)
+    result = compare_prompt_cache(operations, tools, args.sessions, args.interval, config)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_prompt_cache_report(result)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Streaming replay of recorded MCP sessions from JSONL traces.
+
+Each line of a trace is one JSON-RPC 2.0 message (request or response).
+Records flow through a generator pipeline into the Traditional MCP
+accounting (simulate_tool_call / TokenAccumulator), so the reader holds only
+the current line plus at most MAX_PENDING in-flight requests awaiting their
+response (older ones are charged the mock response). Error responses are
+charged with their error text. Large
+traces can be split across worker processes by byte offset.
+
+Run with: python replay.py trace.jsonl --workers 4
+"""
+from __future__ import annotations
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import count_tokens, TokenAccumulator
+from mock_mcp_server import MCPTool, as_registry
+from traditional_mcp import SYSTEM_PROMPT, build_tools_context, simulate_tool_discovery, simulate_tool_call
+
+MAX_PENDING = 10_000  # In-flight requests kept while waiting for their responses
+
+
+@dataclass
+class ReplayResult:
+    """Accounting and throughput for one replayed trace (or shard)."""
+    accumulator: TokenAccumulator = field(default_factory=lambda: TokenAccumulator("Traditional MCP (replay)"))
+    records: int = 0
+    skipped: int = 0
+    tool_calls: int = 0
+    bytes_read: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    def merge(self, other: ReplayResult) -> None:
+        self.accumulator.merge(other.accumulator)
+        self.records += other.records
+        self.skipped += other.skipped
+        self.tool_calls += other.tool_calls
+        self.bytes_read += other.bytes_read
+
+    def to_dict(self) -> dict:
+        return {
+            "records": self.records, "skipped": self.skipped, "tool_calls": self.tool_calls,
+            "bytes_read": self.bytes_read, "elapsed_seconds": round(self.elapsed_seconds, 4),
+            "records_per_second": round(self.records_per_second, 1),
+            "tokens": self.accumulator.summary()
+        }
+
+
+def iter_lines(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield raw lines whose first byte lies in [start, end).
+
+    A shard starting mid-line skips forward to the next line; that line is
+    owned by the previous shard, which reads past its end to finish it.
+    """
+    with open(path, "rb") as f:
+        pos = start
+        if start > 0:
+            f.seek(start - 1)
+            if f.read(1) != b"\n":
+                pos += len(f.readline())
+        while end is None or pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line
+
+
+def _well_formed(record) -> bool:
+    """A JSON-RPC message with the field types replay relies on."""
+    if not isinstance(record, dict) or not isinstance(record.get("id"), (str, int, float, type(None))):
+        return False
+    method = record.get("method")
+    if method is None:
+        return True
+    params = record.get("params", {})
+    if not isinstance(method, str) or not isinstance(params, dict):
+        return False
+    return method != "tools/call" or (isinstance(params.get("name", ""), str)
+                                      and isinstance(params.get("arguments", {}), dict))
+
+
+def iter_records(lines: Iterator[bytes], stats: ReplayResult) -> Iterator[dict]:
+    """Parse JSON-RPC messages, counting blank, malformed or mistyped lines as skipped."""
+    for line in lines:
+        stats.bytes_read += len(line)
+        try:
+            record = json.loads(line)
+        except ValueError:
+            stats.skipped += 1
+            continue
+        if not _well_formed(record):
+            stats.skipped += 1
+            continue
+        stats.records += 1
+        yield record
+
+
+def _response_text(result: dict) -> str:
+    texts = [c["text"] for c in result.get("content", []) if isinstance(c, dict) and "text" in c]
+    return "\n".join(texts) if texts else json.dumps(result, indent=2)
+
+
+def _error_text(error) -> str:
+    return str(error.get("message", "")) if isinstance(error, dict) else json.dumps(error)
+
+
+def _call_event(request: dict, response_text: Optional[str]) -> tuple:
+    params = request.get("params", {})
+    return ("call", params.get("name", ""), params.get("arguments", {}), response_text)
+
+
+def iter_events(records: Iterator[dict], max_pending: int = MAX_PENDING) -> Iterator[tuple]:
+    """Pair requests with responses by id.
+
+    Yields ("tools", [MCPTool, ...]) for tools/list results and
+    ("call", name, arguments, response_text) for tools/call exchanges (the
+    error message for error responses). Calls whose response never arrives
+    are yielded with response_text None once more than max_pending requests
+    are waiting (oldest first), or at the end.
+    """
+    pending: dict = {}
+    for record in records:
+        method = record.get("method")
+        if method is not None:
+            if method in ("tools/list", "tools/call") and "id" in record:
+                pending[record["id"]] = record
+                if len(pending) > max_pending:
+                    oldest = pending.pop(next(iter(pending)))
+                    if oldest["method"] == "tools/call":
+                        yield _call_event(oldest, None)
+            elif method == "tools/call":
+                yield _call_event(record, None)
+            continue
+        request = pending.pop(record.get("id"), None)
+        if request is None:
+            continue
+        result = record.get("result")
+        if request["method"] == "tools/call":
+            if "error" in record:
+                yield _call_event(request, _error_text(record["error"]))
+            elif isinstance(result, dict):
+                yield _call_event(request, _response_text(result))
+        elif isinstance(result, dict) and isinstance(result.get("tools"), list):
+            yield ("tools", [MCPTool(t.get("name", ""), t.get("description", ""), t.get("inputSchema", {}))
+                             for t in result["tools"] if isinstance(t, dict)])
+    for request in pending.values():
+        if request["method"] == "tools/call":
+            yield _call_event(request, None)
+
+
+def find_catalog(path: str, max_records: int = 10000) -> Optional[list[MCPTool]]:
+    """Return the first tools/list catalog in a trace, scanning at most max_records lines."""
+    stats = ReplayResult()
+    lines = (line for i, line in zip(range(max_records), iter_lines(path)))
+    for event in iter_events(iter_records(lines, stats)):
+        if event[0] == "tools":
+            return event[1]
+    return None
+
+
+def replay_trace(path: str, start: int = 0, end: Optional[int] = None,
+                 catalog: Optional[list[MCPTool]] = None, exact: bool = True) -> ReplayResult:
+    """Replay a trace (or a byte range of it) through the Traditional MCP accounting.
+
+    A tools/list result charges the initial context the same way as
+    run_traditional_simulation; each tool call is charged a partial context
+    reload for the current catalog. Calls seen before any catalog use
+    `catalog` (default: the travel tools). With exact=False, per-call
+    metrics come from the calibrated compositional estimator.
+    """
+    if exact:
+        call = simulate_tool_call
+    else:
+        from token_estimation import get_estimator
+        call = get_estimator().estimate
+    result = ReplayResult()
+    acc = result.accumulator
+    started = time.perf_counter()
+    context_reload = count_tokens(build_tools_context(catalog)) // 2
+    for event in iter_events(iter_records(iter_lines(path, start, end), result)):
+        if event[0] == "tools":
+            registry = as_registry(event[1])
+            tools_context = build_tools_context(registry)
+            acc.initial_context_tokens += count_tokens(SYSTEM_PROMPT + tools_context) + simulate_tool_discovery(registry)
+            context_reload = count_tokens(tools_context) // 2
+            continue
+        _, name, args, response_text = event
+        metrics = call(name, args, response_text)
+        metrics.context_tokens = context_reload
+        acc.add_operation(metrics)
+        result.tool_calls += 1
+    result.elapsed_seconds = time.perf_counter() - started
+    return result
+
+
+def shard_offsets(path: str, shards: int) -> list[tuple[int, int]]:
+    """Split a file into byte ranges of roughly equal size."""
+    size = os.path.getsize(path)
+    step = max(1, -(-size // max(1, shards)))
+    return [(lo, min(lo + step, size)) for lo in range(0, size, step)] or [(0, 0)]
+
+
+def replay_sharded(path: str, workers: int, exact: bool = True) -> ReplayResult:
+    """Replay one trace across worker processes, one byte-offset shard each.
+
+    Request/response pairs split by a shard boundary fall back to the mock
+    response; shards after the first use the trace's first catalog.
+    """
+    started = time.perf_counter()
+    catalog = find_catalog(path)
+    combined = ReplayResult()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(replay_trace, path, lo, hi, catalog, exact) for lo, hi in shard_offsets(path, workers)]
+        for future in futures:
+            combined.merge(future.result())
+    combined.elapsed_seconds = time.perf_counter() - started
+    return combined
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay recorded MCP JSON-RPC traces for token accounting")
+    parser.add_argument("trace", help="JSONL file of JSON-RPC messages")
+    parser.add_argument("--workers", type=int, default=1, help="Shard the trace across this many processes")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    parser.add_argument("--exact", action="store_true",
+                        help="Count every call exactly instead of using the compositional estimator")
+
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        result = replay_sharded(args.trace, args.workers, exact=args.exact)
+    else:
+        result = replay_trace(args.trace, exact=args.exact)
+    if args.json:
+        print(json.dumps(result.to_dict(), indent=2))
+    else:
+        summary = result.accumulator.summary()
+        print(f"Replayed {result.records:,} records ({result.skipped:,} skipped), "
+              f"{result.tool_calls:,} tool calls in {result.elapsed_seconds:.2f}s "
+              f"({result.records_per_second:,.0f} records/s)")
+        print(f"Traditional MCP: {summary['grand_total']:,} tokens ({summary['tokens_per_operation']:.0f}/op)")
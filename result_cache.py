@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Content-addressed incremental re-run cache for experiment results.
+
+Each simulated quantity is stored under a digest of exactly the inputs it
+depends on:
+
+  traditional context    system prompt + the catalog's tool schemas
+  traditional tool call  tool name + arguments + that tool's mock response
+  traditional scenario   context digest + the ordered tool call digests
+  code execution         system prompt + capability manifest + batch documents
+                         (+ catalog + operations + their mock responses for a catalog)
+
+all combined with an encoder fingerprint (active encodings, tiktoken
+version, wire format, source of the simulation modules, and for estimated
+calls the estimator's calibration inputs). Unchanged scenarios read their
+TokenAccumulator summary back; editing one tool schema recomputes only the
+context of catalogs containing it, while tool calls and code-execution
+results are reused. Changes to the mock server's envelopes are not
+fingerprinted: bump CACHE_VERSION.
+
+Entries are JSON files in a directory (<root>/<ab>/<digest>.json) written to
+a temp file and renamed into place, so parallel workers can share one store.
+
+Run with: python result_cache.py --stats
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Callable, Iterable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import TokenCount, TokenMetrics, TokenAccumulator, active_encodings, encoding_epoch
+from mock_mcp_server import MCPTool, ToolRegistry, MOCK_RESPONSES, as_registry
+from wire_formats import get_wire_format, wire_format_epoch
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".result_cache")
+# Modules whose code decides how payloads become token counts
+_SOURCES = ("token_counter.py", "wire_formats.py", "traditional_mcp.py", "code_execution.py", "token_estimation.py",
+            "sandbox.py")
+
+
+def digest(*parts) -> str:
+    """Stable content hash of JSON-serializable parts."""
+    text = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=repr)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResultStore:
+    """JSON values in a directory addressed by digest; safe for concurrent readers and writers."""
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR):
+        self.root = root
+        self.hits = self.misses = self.writes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value) -> None:
+        # Write-then-rename: readers see no entry or a complete one; racing writers store equal values
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.writes += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], object]):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def entries(self) -> Iterable[str]:
+        """Paths of all stored entries."""
+        for shard, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".json") and not name.startswith(".tmp-"):
+                    yield os.path.join(shard, name)
+
+    def stats(self) -> dict:
+        paths = list(self.entries())
+        return {"root": self.root, "entries": len(paths), "bytes": sum(os.path.getsize(p) for p in paths),
+                "hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+    def clear(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _pack(value) -> object:
+    return [int(value), value.by_encoding] if isinstance(value, TokenCount) else int(value)
+
+
+def _unpack(value) -> int:
+    return TokenCount(value[0], value[1]) if isinstance(value, list) else value
+
+
+_fingerprints: dict[tuple[int, int], str] = {}
+
+
+def encoder_fingerprint() -> str:
+    """Digest of everything besides the payloads that affects a count."""
+    key = (encoding_epoch(), wire_format_epoch())
+    if key not in _fingerprints:
+        try:
+            from importlib.metadata import version
+            tiktoken_version = version("tiktoken")
+        except Exception:
+            tiktoken_version = None
+        here = os.path.dirname(os.path.abspath(__file__))
+        sources = []
+        for name in _SOURCES:
+            with open(os.path.join(here, name), "rb") as f:
+                sources.append(hashlib.blake2b(f.read(), digest_size=16).hexdigest())
+        _fingerprints[key] = digest(CACHE_VERSION, active_encodings(), tiktoken_version,
+                                    get_wire_format().name, sources)
+    return _fingerprints[key]
+
+
+def traditional_summary(operations: list[dict], tools: ToolRegistry | Iterable[MCPTool] | None = None,
+                        exact: bool = True, store: Optional[ResultStore] = None,
+                        catalog_key: Optional[str] = None) -> dict:
+    """run_traditional_simulation(operations, tools, estimator).summary(), recomputing only changed parts.
+
+    With exact=False calls are estimated (see token_estimation); the estimator is only
+    calibrated if a call is missing from the store. catalog_key stands in for the tools'
+    schemas when the catalog is known by how it was built (see sweep.py), so cached
+    scenarios never serialize it.
+    """
+    from traditional_mcp import SYSTEM_PROMPT, TRAVEL_OPERATIONS, simulate_tool_call, traditional_context_tokens
+    store = store or ResultStore()
+    fingerprint = encoder_fingerprint()
+    registry = None
+    if catalog_key is None:
+        registry = as_registry(tools)
+        catalog_key = registry.memo(("result_cache.catalog", fingerprint), lambda: digest(registry.tools_json()))
+    context_key = digest("traditional.context", fingerprint, SYSTEM_PROMPT, catalog_key)
+    # Estimates also depend on what the estimator was calibrated on
+    call_fingerprint = fingerprint if exact else digest(fingerprint, TRAVEL_OPERATIONS, MOCK_RESPONSES)
+    call_keys: dict[int, str] = {}  # id(op) -> digest; operation lists usually repeat a few dicts
+    for op in operations:
+        if id(op) not in call_keys:
+            call_keys[id(op)] = digest("traditional.call", call_fingerprint, exact, op["tool"], op["args"],
+                                       MOCK_RESPONSES.get(op["tool"]))
+    scenario_key = digest("traditional.scenario", context_key, [call_keys[id(op)] for op in operations])
+    summary = store.get(scenario_key)
+    if summary is not None:
+        return summary
+
+    estimator = None
+
+    def call(op: dict) -> list:
+        nonlocal estimator
+        if exact:
+            metrics = simulate_tool_call(op["tool"], op["args"])
+        else:
+            if estimator is None:
+                from token_estimation import get_estimator
+                estimator = get_estimator()
+            metrics = estimator.estimate(op["tool"], op["args"])
+        return [_pack(metrics.reasoning_tokens), _pack(metrics.tool_call_tokens), _pack(metrics.response_tokens)]
+
+    acc = TokenAccumulator("Traditional MCP")
+    initial, reload = store.get_or_compute(context_key, lambda: [_pack(n) for n in traditional_context_tokens(
+        registry if registry is not None else tools)])
+    acc.initial_context_tokens, reload = _unpack(initial), _unpack(reload)
+    calls: dict[str, list] = {}
+    for op in operations:
+        key = call_keys[id(op)]
+        if key not in calls:
+            calls[key] = [_unpack(v) for v in store.get_or_compute(key, lambda: call(op))]
+        acc.add_operation(TokenMetrics(reload, *calls[key]))
+    summary = acc.summary()
+    store.put(scenario_key, summary)
+    return summary
+
+
+def code_execution_summary(operations: list[dict], store: Optional[ResultStore] = None,
+                           tools: ToolRegistry | Iterable[MCPTool] | None = None,
+                           catalog_key: Optional[str] = None) -> dict:
+    """run_code_execution_simulation(operations, tools=tools).summary(), read back when its inputs are unchanged.
+    
+    Without tools (or catalog_key) this is the fixed scenario, which ignores the operations.
+    """
+    import code_execution as ce
+    store = store or ResultStore()
+    fingerprint = encoder_fingerprint()
+    if tools is None and catalog_key is None:
+        # The canned batch intent does not depend on the operation list (the module source is fingerprinted)
+        key = digest("code_execution", fingerprint, ce.SYSTEM_PROMPT, ce.CAPABILITY_MANIFEST,
+                     ce.BATCH_REQUEST, ce.AGGREGATED_RESPONSE)
+        return store.get_or_compute(key, lambda: ce.run_code_execution_simulation(operations).summary())
+    registry = as_registry(tools)
+    if catalog_key is None:
+        catalog_key = registry.memo(("result_cache.catalog", fingerprint), lambda: digest(registry.tools_json()))
+    used = sorted({op["tool"] for op in operations})
+    key = digest("code_execution.catalog", fingerprint, ce.SYSTEM_PROMPT, ce.CAPABILITY_MANIFEST, catalog_key,
+                 [[op["tool"], op["args"]] for op in operations], {name: MOCK_RESPONSES.get(name) for name in used})
+    return store.get_or_compute(key, lambda: ce.run_code_execution_simulation(operations, tools=registry).summary())
+
+
+def cached_comparison(operations: list[dict], tools: ToolRegistry | Iterable[MCPTool] | None = None,
+                      exact: bool = True, store: Optional[ResultStore] = None,
+                      catalog_key: Optional[str] = None) -> dict:
+    """compare_paradigms over cached summaries of both paradigms."""
+    from analysis import compare_summaries
+    store = store or ResultStore()
+    return compare_summaries(traditional_summary(operations, tools, exact, store, catalog_key),
+                             code_execution_summary(operations, store, tools, catalog_key))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the incremental result cache")
+    parser.add_argument("--dir", default=DEFAULT_CACHE_DIR, help="Cache directory")
+    parser.add_argument("--stats", action="store_true", help="Print entry count and size (default)")
+    parser.add_argument("--clear", action="store_true", help="Delete every entry")
+
+    args = parser.parse_args()
+    store = ResultStore(args.dir)
+    if args.clear:
+        store.clear()
+        print(f"[Cache cleared: {args.dir}]")
+    else:
+        stats = store.stats()
+        print(f"{stats['entries']:,} entries, {stats['bytes'] / 1024:,.1f} KB in {stats['root']}")
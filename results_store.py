@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Append-only SQLite store for experiment results.
+
+analysis.save_results keeps only the latest comparison in results.json;
+ResultsStore appends every run. A run records when it ran, the git
+revision, the active encodings, the wire format and exact or estimated
+counting. Each scenario (N tools, M operations) adds one row per paradigm
+and encoding holding the TokenAccumulator summary totals. Rows are indexed
+on scenario parameters, paradigm, encoder and git revision. The `savings`
+view pairs both paradigms of a scenario, so aggregates run in SQL rather
+than over loaded JSON. The database runs in WAL mode: parallel sweeps
+append in batched transactions while others query, and triggers reject
+UPDATE and DELETE.
+
+Run with: python results_store.py query --by n_tools
+          python results_store.py export --n-tools 5 --n-ops 5 --output slice.jsonl
+"""
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.db")
+PARADIGMS = {"traditional": "Traditional MCP", "code_execution": "Code Execution"}
+_TOTALS = ("initial_context_tokens", "total_context_tokens", "total_reasoning_tokens",
+           "total_tool_call_tokens", "total_response_tokens", "grand_total")
+# Columns of the savings view usable in filters and GROUP BY
+FILTER_COLUMNS = ("run_id", "n_tools", "n_operations", "encoder", "git_rev", "wire_format", "exact", "source")
+METRICS = ("savings_percentage", "traditional_total", "code_execution_total")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    git_rev TEXT,
+    source TEXT NOT NULL,
+    encodings TEXT NOT NULL,
+    wire_format TEXT NOT NULL,
+    exact INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    scenario INTEGER NOT NULL,
+    n_tools INTEGER NOT NULL,
+    n_operations INTEGER NOT NULL,
+    paradigm TEXT NOT NULL,
+    encoder TEXT NOT NULL,
+    git_rev TEXT,
+    operation_count INTEGER NOT NULL,
+    {", ".join(f"{c} INTEGER NOT NULL" for c in _TOTALS)},
+    PRIMARY KEY (run_id, scenario, paradigm, encoder)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_scenario ON results(n_tools, n_operations);
+CREATE INDEX IF NOT EXISTS results_paradigm_encoder ON results(paradigm, encoder);
+CREATE INDEX IF NOT EXISTS results_git_rev ON results(git_rev);
+CREATE INDEX IF NOT EXISTS runs_git_rev ON runs(git_rev);
+CREATE VIEW IF NOT EXISTS savings AS
+SELECT t.run_id, t.scenario, t.n_tools, t.n_operations, t.encoder, t.git_rev,
+       r.wire_format, r.exact, r.source, r.created_at,
+       t.grand_total AS traditional_total, c.grand_total AS code_execution_total,
+       CASE WHEN t.grand_total > 0 THEN 100.0 * (t.grand_total - c.grand_total) / t.grand_total ELSE 0 END
+           AS savings_percentage
+FROM results t
+JOIN results c ON c.run_id = t.run_id AND c.scenario = t.scenario
+              AND c.paradigm = 'code_execution' AND c.encoder = t.encoder
+JOIN runs r ON r.run_id = t.run_id
+WHERE t.paradigm = 'traditional';
+""" + "".join(f"""
+CREATE TRIGGER IF NOT EXISTS {table}_no_{op.lower()} BEFORE {op} ON {table}
+BEGIN SELECT RAISE(ABORT, 'results store is append-only'); END;""" for table in ("runs", "results") for op in ("UPDATE", "DELETE"))
+
+
+def git_revision() -> Optional[str]:
+    """Short commit hash of this checkout, suffixed -dirty with uncommitted changes (None outside git)."""
+    try:
+        proc = subprocess.run(["git", "describe", "--always", "--dirty", "--abbrev=12"], capture_output=True,
+                              text=True, timeout=10, cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return proc.stdout.strip() or None
+
+
+def _where(filters: Optional[dict], alias: str = "") -> tuple[str, list]:
+    clauses, params = [], []
+    for column, value in (filters or {}).items():
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"unknown filter column {column!r} (have {FILTER_COLUMNS})")
+        if value is not None:
+            clauses.append(f"{alias}{column} = ?")
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class ResultsStore:
+    """Append-only results database; one instance per process (connections are not shared)."""
+
+    def __init__(self, path: str = DEFAULT_DB, timeout: float = 60.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> ResultsStore:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def begin_run(self, source: str, exact: bool = True, git_rev: Optional[str] = None) -> int:
+        """Record a run under the active encodings and wire format; returns its run_id."""
+        from token_counter import active_encodings
+        from wire_formats import get_wire_format
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (created_at, git_rev, source, encodings, wire_format, exact) VALUES (?, ?, ?, ?, ?, ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%S"), git_rev or git_revision(), source,
+                 ",".join(active_encodings()), get_wire_format().name, int(exact)))
+        return cursor.lastrowid
+
+    def add_scenarios(self, run_id: int, cells: Iterable[dict]) -> int:
+        """Bulk-insert scenarios in one transaction; returns how many were added.
+
+        Each cell needs n_tools, n_operations and the traditional / code_execution summaries
+        (a sweep.run_cell result, or a compare_paradigms dict plus N and M).
+        """
+        run = self.conn.execute("SELECT git_rev, encodings FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if run is None:
+            raise ValueError(f"unknown run_id {run_id}")
+        primary = run["encodings"].split(",")[0]
+        # Scenarios are numbered per run; a run has a single writer
+        start = self.conn.execute("SELECT COALESCE(MAX(scenario) + 1, 0) FROM results WHERE run_id = ?",
+                                  (run_id,)).fetchone()[0]
+        added = 0
+
+        def rows() -> Iterator[tuple]:
+            nonlocal added
+            for scenario, cell in enumerate(cells, start):
+                added += 1
+                for paradigm in PARADIGMS:
+                    summary = cell[paradigm]
+                    for encoder, totals in (summary.get("by_encoding") or {primary: summary}).items():
+                        yield (run_id, scenario, cell["n_tools"], cell["n_operations"], paradigm, encoder,
+                               run["git_rev"], summary["operation_count"], *(totals[c] for c in _TOTALS))
+
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO results VALUES ({', '.join('?' * (8 + len(_TOTALS)))})", rows())
+        return added
+
+    def record(self, comparison: dict, source: str, n_tools: int, n_operations: int, exact: bool = True) -> int:
+        """Append a single-scenario run (e.g. run_experiment's comparison); returns its run_id."""
+        run_id = self.begin_run(source, exact)
+        self.add_scenarios(run_id, [{"n_tools": n_tools, "n_operations": n_operations, **comparison}])
+        return run_id
+
+    def latest_run(self) -> Optional[int]:
+        return self.conn.execute("SELECT MAX(run_id) FROM runs").fetchone()[0]
+
+    def runs(self, limit: int = 20) -> list[dict]:
+        """Most recent runs with their scenario counts."""
+        return [dict(r) for r in self.conn.execute(
+            "SELECT r.*, (SELECT COUNT(DISTINCT scenario) FROM results WHERE run_id = r.run_id) AS scenarios "
+            "FROM runs r ORDER BY run_id DESC LIMIT ?", (limit,))]
+
+    def aggregate(self, by: Iterable[str] = ("n_tools",), filters: Optional[dict] = None,
+                  metric: str = "savings_percentage") -> list[dict]:
+        """COUNT / AVG / MIN / MAX of a savings-view metric grouped by columns (e.g. savings by N)."""
+        by = list(by)
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r} (have {METRICS})")
+        for column in by:
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f"unknown group column {column!r} (have {FILTER_COLUMNS})")
+        where, params = _where(filters)
+        group = f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""
+        sql = (f"SELECT {''.join(c + ', ' for c in by)}COUNT(*) AS scenarios, AVG({metric}) AS mean, "
+               f"MIN({metric}) AS min, MAX({metric}) AS max FROM savings{where}{group}")
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def grid(self, filters: Optional[dict] = None) -> list[dict]:
+        """Savings-view rows (run, encoder, N, M, both totals, savings) ordered for charting."""
+        where, params = _where(filters)
+        return [dict(r) for r in self.conn.execute(
+            "SELECT run_id, encoder, n_tools, n_operations, traditional_total, code_execution_total, "
+            f"savings_percentage FROM savings{where} ORDER BY run_id, encoder, n_tools, n_operations", params)]
+
+    def comparisons(self, filters: Optional[dict] = None, limit: Optional[int] = None) -> Iterator[dict]:
+        """Stream matching scenarios as compare_paradigms-style dicts (input for analysis.generate_chart)."""
+        from analysis import compare_summaries
+        where, params = _where(filters, "s.")
+        sql = (f"SELECT s.run_id, s.scenario, s.encoder, s.git_rev, s.n_tools, s.n_operations, "
+               f"r.paradigm, r.operation_count, {', '.join('r.' + c for c in _TOTALS)} FROM savings s "
+               f"JOIN results r ON r.run_id = s.run_id AND r.scenario = s.scenario AND r.encoder = s.encoder"
+               f"{where} ORDER BY s.run_id, s.scenario, s.encoder, r.paradigm DESC")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(2 * limit)
+        cursor = self.conn.execute(sql, params)
+        # Rows arrive paired: traditional then code_execution for each scenario and encoder
+        for trad, code in zip(cursor, cursor):
+            summaries = {}
+            for row in (trad, code):
+                count = row["operation_count"]
+                summaries[row["paradigm"]] = {
+                    "paradigm": PARADIGMS[row["paradigm"]], "operation_count": count,
+                    **{c: row[c] for c in _TOTALS},
+                    "tokens_per_operation": round(row["grand_total"] / count if count else 0.0, 2)
+                }
+            comparison = compare_summaries(summaries["traditional"], summaries["code_execution"])
+            comparison["scenario"] = {k: trad[k] for k in ("run_id", "scenario", "n_tools", "n_operations",
+                                                           "encoder", "git_rev")}
+            yield comparison
+
+
+def _filters(args) -> dict:
+    run_id = args.run
+    if run_id == "latest":
+        with ResultsStore(args.db) as store:
+            run_id = store.latest_run()
+    return {"run_id": int(run_id) if run_id is not None else None, "git_rev": args.git_rev, "encoder": args.encoder,
+            "wire_format": args.wire_format, "n_tools": args.n_tools, "n_operations": args.n_ops}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Append-only results store: ingest, aggregate and export runs")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Append a sweep.py JSON-lines file as one run")
+    ingest.add_argument("path")
+    ingest.add_argument("--encodings", help="Encodings the sweep ran under (default: the active default)")
+    ingest.add_argument("--wire-format", default="json", help="Wire format the sweep ran under")
+    commands.add_parser("runs", help="List recent runs")
+    query = commands.add_parser("query", help="Aggregate a metric over matching scenarios")
+    query.add_argument("--by", default="n_tools", help=f"Comma-separated group columns from {FILTER_COLUMNS}")
+    query.add_argument("--metric", choices=METRICS, default="savings_percentage")
+    query.add_argument("--json", action="store_true", help="Print the result as JSON")
+    export = commands.add_parser("export", help="Write matching scenarios as JSON lines for generate_chart")
+    export.add_argument("--output", help="Output file (default stdout)")
+    export.add_argument("--limit", type=int)
+    for sub in (query, export):
+        sub.add_argument("--run", help="run_id or 'latest'")
+        sub.add_argument("--git-rev")
+        sub.add_argument("--encoder")
+        sub.add_argument("--wire-format")
+        sub.add_argument("--n-tools", type=int)
+        sub.add_argument("--n-ops", type=int)
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        from token_counter import set_encodings
+        from wire_formats import set_wire_format
+        if args.encodings:
+            set_encodings(*[e.strip() for e in args.encodings.split(",") if e.strip()])
+        set_wire_format(args.wire_format)
+        with open(args.path) as f, ResultsStore(args.db) as store:
+            cells = (json.loads(line) for line in f if line.strip())
+            first = next(cells, None)
+            if first is None:
+                sys.exit(f"{args.path}: no scenarios")
+            run_id = store.begin_run("sweep", first.get("exact", False))
+            added = store.add_scenarios(run_id, [first, *cells])
+        print(f"[Run {run_id}: {added:,} scenarios from {args.path}]")
+    elif args.command == "runs":
+        with ResultsStore(args.db) as store:
+            for run in store.runs():
+                print(f"{run['run_id']:>6}  {run['created_at']}  {run['source']:<14} {run['git_rev'] or '-':<20} "
+                      f"{run['encodings']:<24} {run['wire_format']:<8} {'exact' if run['exact'] else 'estimated':<9} "
+                      f"{run['scenarios']:>8,} scenarios")
+    elif args.command == "query":
+        by = [c.strip() for c in args.by.split(",") if c.strip()]
+        with ResultsStore(args.db) as store:
+            rows = store.aggregate(by, _filters(args), args.metric)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print(" ".join(f"{c:>14}" for c in by) + f" {'scenarios':>10} {'mean':>12} {'min':>12} {'max':>12}")
+            for r in rows:
+                print(" ".join(f"{str(r[c]):>14}" for c in by) +
+                      f" {r['scenarios']:>10,} {r['mean']:>12.2f} {r['min']:>12.2f} {r['max']:>12.2f}")
+    else:
+        out = open(args.output, "w") if args.output else sys.stdout
+        count = 0
+        try:
+            with ResultsStore(args.db) as store:
+                for comparison in store.comparisons(_filters(args), args.limit):
+                    out.write(json.dumps(comparison) + "\n")
+                    count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"[Exported {count:,} scenarios]", file=sys.stderr)
@@ -9,15 +9,17 @@ This experiment compares token consumption between:
 Run with: python experiment/run_experiment.py
 """
 
+import json
 import os
 import sys
+import time
+from typing import Optional
 
 # Add experiment directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from traditional_mcp import run_traditional_simulation, TRAVEL_OPERATIONS
-from code_execution import run_code_execution_simulation
-from analysis import compare_paradigms, print_comparison_table, generate_chart, save_results
+# Simulation modules (and through them tiktoken, matplotlib and tabulate) are
+# imported inside the functions that need them, keeping CLI startup cheap.
 
 
 def print_header():
@@ -34,6 +36,7 @@ def print_header():
 
 def print_scenario():
     """Print the test scenario."""
+    from traditional_mcp import TRAVEL_OPERATIONS
     print("TEST SCENARIO: Travel Planning Assistant")
     print("─" * 50)
     print("Operations to execute:")
@@ -42,50 +45,103 @@ def print_scenario():
     print()
 
 
-def run_experiment(generate_charts: bool = True, save_json: bool = True) -> dict:
+def run_experiment(generate_charts: bool = True, save_json: bool = True, profile: bool = False,
+                   prompt_cache: bool = False, cache: bool = True, results_db: Optional[str] = None) -> dict:
     """
     Run the complete experiment.
     
     Args:
         generate_charts: Whether to generate matplotlib charts
         save_json: Whether to save results to JSON file
+        profile: Whether to collect per-stage timings with cProfile and tracemalloc
+        prompt_cache: Whether to add the prompt-cache cost/TTFT model (see prompt_cache.py)
+        cache: Whether to reuse unchanged results from the result cache (see result_cache.py);
+            ignored when profiling
+        results_db: Append the run to this results store (see results_store.py); "" means
+            the default results.db, None skips it
         
     Returns:
         Comparison results dictionary
     """
+    from traditional_mcp import run_traditional_simulation, TRAVEL_OPERATIONS
+    from code_execution import run_code_execution_simulation
+    from analysis import compare_summaries, print_comparison_table, generate_chart, save_results
+    
+    import instrumentation
+    
     print_header()
     print_scenario()
     
+    if profile:
+        instrumentation.enable(cprofile=True, trace_memory=True)
+    store = None
+    if cache and not profile:
+        from result_cache import ResultStore, traditional_summary, code_execution_summary
+        store = ResultStore()
+    
     # Run Traditional MCP simulation
     print("Running Traditional MCP Architecture simulation...")
-    traditional_results = run_traditional_simulation(TRAVEL_OPERATIONS)
-    print(f"  ✓ Completed: {traditional_results.grand_total:,} total tokens\n")
+    if store is not None:
+        traditional_results = traditional_summary(TRAVEL_OPERATIONS, store=store)
+    else:
+        traditional_results = run_traditional_simulation(TRAVEL_OPERATIONS).summary()
+    print(f"  ✓ Completed: {traditional_results['grand_total']:,} total tokens\n")
     
     # Run Code Execution simulation
     print("Running Code Execution Paradigm simulation...")
-    code_execution_results = run_code_execution_simulation(TRAVEL_OPERATIONS)
-    print(f"  ✓ Completed: {code_execution_results.grand_total:,} total tokens\n")
+    if store is not None:
+        code_execution_results = code_execution_summary(TRAVEL_OPERATIONS, store)
+    else:
+        code_execution_results = run_code_execution_simulation(TRAVEL_OPERATIONS).summary()
+    print(f"  ✓ Completed: {code_execution_results['grand_total']:,} total tokens\n")
+    if store is not None:
+        print(f"[Result cache: {store.hits} reused, {store.writes} computed in {store.root}]\n")
     
     # Compare results
-    comparison = compare_paradigms(traditional_results, code_execution_results)
+    comparison = compare_summaries(traditional_results, code_execution_results)
+    
+    if profile:
+        instrumentation.disable()
+        report = instrumentation.report()
+        instrumentation.print_report(report)
+        profile_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_report.json")
+        with open(profile_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Profile saved: {profile_path}]")
+        instrumentation.reset()
     
     # Print comparison table
     print_comparison_table(comparison)
     
+    if prompt_cache:
+        from prompt_cache import compare_prompt_cache, print_prompt_cache_report
+        comparison["prompt_cache"] = compare_prompt_cache(TRAVEL_OPERATIONS)
+        print_prompt_cache_report(comparison["prompt_cache"])
+    
     # Save results
+    results_changed = True
     if save_json:
         output_dir = os.path.dirname(os.path.abspath(__file__))
         json_path = os.path.join(output_dir, "results.json")
-        save_results(comparison, json_path)
+        results_changed = save_results(comparison, json_path)
+    if results_db is not None:
+        from mock_mcp_server import TRAVEL_MCP_TOOLS
+        from results_store import DEFAULT_DB, ResultsStore
+        with ResultsStore(results_db or DEFAULT_DB) as results_store:
+            run_id = results_store.record(comparison, "run_experiment", len(TRAVEL_MCP_TOOLS), len(TRAVEL_OPERATIONS))
+        print(f"[Run {run_id} appended: {results_store.path}]")
     
     # Generate charts
     if generate_charts:
         output_dir = os.path.dirname(os.path.abspath(__file__))
         chart_path = os.path.join(output_dir, "token_comparison_chart.png")
-        try:
-            generate_chart(comparison, chart_path)
-        except Exception as e:
-            print(f"\n[Chart generation failed: {e}]")
+        if not results_changed and os.path.exists(chart_path):
+            print(f"[Chart up to date: {chart_path}]")
+        else:
+            try:
+                generate_chart(comparison, chart_path)
+            except Exception as e:
+                print(f"\n[Chart generation failed: {e}]")
     
     # Print conclusion
     print_conclusion(comparison)
@@ -133,16 +189,81 @@ Further investigation may be needed to understand the discrepancy.
     print("═" * 70)
 
 
+def startup_profile(top: int = 15) -> None:
+    """Report per-module import time for this CLI plus the costs it defers to first use."""
+    import subprocess
+    
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import run_experiment"],
+                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[0].startswith("import time:") and parts[1].strip().isdigit():
+            rows.append((int(parts[0].split(":")[1]), int(parts[1]), parts[2].rstrip()))
+    total = next((cumulative for _, cumulative, module in rows if module.strip() == "run_experiment"), 0)
+    
+    print(f"STARTUP PROFILE: import run_experiment = {total / 1000:.1f} ms (cumulative)")
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for self_us, cumulative_us, module in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {module}")
+    
+    print("\nDeferred until first use:")
+    deferred = [
+        ("simulation modules", lambda: [__import__(m) for m in ("traditional_mcp", "code_execution", "analysis")]),
+        ("tiktoken encoder", lambda: __import__("token_counter").get_encoder()),
+        ("tabulate", lambda: __import__("tabulate")),
+        ("matplotlib.pyplot", lambda: __import__("matplotlib.pyplot")),
+    ]
+    for label, load in deferred:
+        start = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            print(f"  {label:<20} unavailable ({e.__class__.__name__})")
+            continue
+        print(f"  {label:<20} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+
 if __name__ == "__main__":
     import argparse
+    from wire_formats import WIRE_FORMATS  # Standard library only; cheap at startup
     
     parser = argparse.ArgumentParser(description="Run MCP Token Consumption Experiment")
     parser.add_argument("--no-charts", action="store_true", help="Skip chart generation")
     parser.add_argument("--no-save", action="store_true", help="Skip saving results to JSON")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Report per-module import time and deferred startup costs, then exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings (with cProfile/tracemalloc) and save profile_report.json")
+    parser.add_argument("--prompt-cache", action="store_true",
+                        help="Also report cached vs uncached input tokens and TTFT under a prefix cache")
+    parser.add_argument("--wire-format", choices=sorted(WIRE_FORMATS), default="json",
+                        help="Payload encoding for both paradigms")
+    parser.add_argument("--store", nargs="?", const="", metavar="DB",
+                        help="Append the run to this results database (default results.db)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Recompute everything instead of reusing unchanged results from the result cache")
+    parser.add_argument("--encodings",
+                        help="Comma-separated tiktoken encodings counted in one pass, e.g. cl100k_base,o200k_base "
+                             "(the first drives the headline numbers)")
     
     args = parser.parse_args()
     
+    if args.startup_profile:
+        startup_profile()
+        sys.exit(0)
+    if args.wire_format != "json":
+        from wire_formats import set_wire_format
+        set_wire_format(args.wire_format)
+    if args.encodings:
+        from token_counter import set_encodings
+        set_encodings(*[e.strip() for e in args.encodings.split(",") if e.strip()])
+    
     run_experiment(
         generate_charts=not args.no_charts,
-        save_json=not args.no_save
+        save_json=not args.no_save,
+        profile=args.profile,
+        prompt_cache=args.prompt_cache,
+        cache=not args.no_cache,
+        results_db=args.store
     )
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Executable sandbox for code-execution batch intents.
+
+simulate_batch_execution charges tokens for a canned aggregated response.
+SandboxExecutor instead interprets the batch-intent document: each
+requirement maps to one whitelisted mock tool, all calls fan out
+concurrently through MCPServer.handle (with its latency/jitter injection)
+under a per-call timeout, and the raw results are aggregated into the
+compressed summary that is returned to the model. Only the summary enters
+the model's context; the raw tool responses stay inside the sandbox.
+
+run_sandbox_benchmark executes many batches, optionally several in
+flight at once, and reports fan-out and tail latency, throughput and the
+tokens returned vs the raw responses the traditional paradigm would load.
+
+Run with: python sandbox.py --latency 0.05 --jitter 0.02 --batches 200 --concurrency 8
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from token_counter import count_tokens
+from mock_mcp_server import RESPONSE_CACHE
+from mcp_transport import MCPServer, MCPRPCError
+from code_execution import BATCH_REQUEST, AGGREGATED_RESPONSE
+from wire_formats import WIRE_FORMATS, get_wire_format, set_wire_format
+
+# Requirement type -> the only tool a requirement of that type may call
+REQUIREMENT_TOOLS = {
+    "flights": "search_flights",
+    "weather": "check_weather",
+    "hotels": "search_hotels",
+    "calendar": "check_calendar"
+}
+
+
+class SandboxError(ValueError):
+    """The batch intent cannot be executed (unknown requirement type, missing fields or invalid dates)."""
+
+
+def _date_range(value: str) -> tuple[str, str]:
+    start, _, end = value.partition(" to ")
+    start, end = start.strip(), (end or start).strip()
+    for day in (start, end):
+        try:
+            date.fromisoformat(day)
+        except ValueError:
+            raise SandboxError(f"invalid dates {value!r}; expected YYYY-MM-DD [to YYYY-MM-DD]") from None
+    return start, end
+
+
+def plan_calls(batch: dict) -> list[tuple[str, str, dict]]:
+    """Map batch requirements to (type, tool, arguments); "same" or missing dates reuse the flight dates."""
+    requirements = batch.get("requirements", [])
+    trip = next((_date_range(r["dates"]) for r in requirements if r.get("type") == "flights" and "dates" in r), None)
+    calls = []
+    for r in requirements:
+        kind = r.get("type")
+        if kind not in REQUIREMENT_TOOLS:
+            raise SandboxError(f"unsupported requirement type {kind!r}")
+        dates = trip if r.get("dates") in (None, "same") else _date_range(r["dates"])
+        try:
+            if kind == "weather":
+                args = {"location": r["location"], "units": "metric", "include_forecast": True}
+            elif dates is None:
+                raise SandboxError(f"{kind} requirement needs dates")
+            elif kind == "flights":
+                args = {"origin": r["from"], "destination": r["to"], "departure_date": dates[0], "return_date": dates[1]}
+            elif kind == "hotels":
+                args = {"destination": r["location"], "check_in": dates[0], "check_out": dates[1]}
+            else:
+                args = {"start_date": dates[0], "end_date": dates[1]}
+        except KeyError as e:
+            raise SandboxError(f"{kind} requirement is missing {e.args[0]!r}") from None
+        calls.append((kind, REQUIREMENT_TOOLS[kind], args))
+    return calls
+
+
+def _one_or_list(items: list):
+    return items[0] if len(items) == 1 else items
+
+
+def aggregate(calls: list[tuple[str, str, dict]], results: list[Optional[dict]]) -> dict:
+    """Compress raw tool results (one per call, None if it failed) into the summary returned to the model.
+    
+    Calls of the same type are aggregated per call: option and conflict counts are summed, the
+    best flight, hotel and weather summary become lists when a type was called more than once,
+    and the estimated cost covers every call.
+    """
+    out: dict = {}
+    recommendations = []
+    cost = 0.0
+    by_kind: dict[str, list[tuple[dict, dict]]] = {}
+    for (kind, _, args), data in zip(calls, results):
+        if data is not None:
+            by_kind.setdefault(kind, []).append((args, data))
+    if "flights" in by_kind:
+        best_flights = []
+        out["flight_options"] = 0
+        for _, data in by_kind["flights"]:
+            flights = data.get("flights", [])
+            out["flight_options"] += len(flights)
+            if flights:
+                best = min(flights, key=lambda f: f["price"])
+                best_flights.append({"price": best["price"], "airline": best["airline"]})
+                recommendations.append(f"Book {best['airline']} flight")
+                cost += best["price"]
+        if best_flights:
+            out["best_flight"] = _one_or_list(best_flights)
+    if "weather" in by_kind:
+        summaries = []
+        for _, data in by_kind["weather"]:
+            forecast = data.get("forecast", [])
+            current = data.get("current", {})
+            if forecast:
+                summaries.append(f"{forecast[0]['conditions']}, {min(d['low'] for d in forecast)}-"
+                                 f"{max(d['high'] for d in forecast)}°C")
+            else:
+                summaries.append(f"{current.get('conditions', 'Unknown')}, {current.get('temperature')}°C")
+        out["weather_summary"] = _one_or_list(summaries)
+    if "hotels" in by_kind:
+        picks = []
+        out["hotel_options"] = 0
+        for args, data in by_kind["hotels"]:
+            hotels = data.get("hotels", [])
+            out["hotel_options"] += len(hotels)
+            if hotels:
+                best = max(hotels, key=lambda h: (h["rating"], -h["price_per_night"]))
+                picks.append({"name": best["name"], "price": best["price_per_night"]})
+                recommendations.append(f"{best['name']} highly rated")
+                nights = max(1, (date.fromisoformat(args["check_out"]) - date.fromisoformat(args["check_in"])).days)
+                cost += best["price_per_night"] * nights
+        if picks:
+            out["recommended_hotel"] = _one_or_list(picks)
+    if "calendar" in by_kind:
+        busy = sum(len(data.get("busy_slots", [])) for _, data in by_kind["calendar"])
+        out["calendar_status"] = f"Available with {busy} conflict(s)" if busy else "Available"
+    if cost:
+        out["total_estimated_cost"] = round(cost, 2)
+    return {"status": "complete", "results": out, "recommendations": recommendations}
+
+
+@dataclass
+class BatchResult:
+    """One executed batch: the summary, per-call timings and token accounting."""
+    summary: dict
+    call_types: list[str]          # Requirement type of each call, in batch order
+    call_seconds: list[float]      # Latency of each call, in batch order
+    fanout_seconds: float
+    errors: dict[int, str] = field(default_factory=dict)  # Call index -> error
+    raw_response_tokens: int = 0   # Tool result envelopes a sequential caller would read
+    summary_tokens: int = 0        # Tokens actually returned to the model
+
+    def to_dict(self) -> dict:
+        return {
+            "summary": self.summary,
+            "calls": [{"type": kind, "ms": round(seconds * 1000, 3), **({"error": self.errors[i]} if i in self.errors else {})}
+                      for i, (kind, seconds) in enumerate(zip(self.call_types, self.call_seconds))],
+            "fanout_ms": round(self.fanout_seconds * 1000, 3),
+            "sequential_ms": round(sum(self.call_seconds) * 1000, 3),
+            "raw_response_tokens": self.raw_response_tokens, "summary_tokens": self.summary_tokens
+        }
+
+
+class SandboxExecutor:
+    """Runs batch intents against the mock tools, fanning requirements out concurrently."""
+
+    def __init__(self, server: Optional[MCPServer] = None, timeout: float = 5.0):
+        self.server = server or MCPServer()
+        self.timeout = timeout
+        self._next_id = 0
+
+    async def _call(self, tool: str, args: dict) -> tuple[Optional[dict], Optional[str], float]:
+        self._next_id += 1
+        message = {"jsonrpc": "2.0", "id": self._next_id, "method": "tools/call",
+                   "params": {"name": tool, "arguments": args}}
+        start = time.perf_counter()
+        try:
+            buffers = await asyncio.wait_for(self.server.handle(message), self.timeout)
+            reply = json.loads(b"".join(buffers))
+            if "error" in reply:
+                raise MCPRPCError(reply["error"]["code"], reply["error"]["message"])
+            return get_wire_format().decode(reply["result"]["content"][0]["text"]), None, time.perf_counter() - start
+        except asyncio.TimeoutError:
+            return None, f"timed out after {self.timeout}s", time.perf_counter() - start
+        except MCPRPCError as e:
+            return None, str(e), time.perf_counter() - start
+
+    async def execute(self, batch: dict) -> BatchResult:
+        """Execute every requirement concurrently and aggregate; failed calls are reported, not raised."""
+        calls = plan_calls(batch)
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._call(tool, args) for _, tool, args in calls))
+        fanout = time.perf_counter() - start
+        results = [data for data, _, _ in outcomes]
+        errors = {i: error for i, (_, error, _) in enumerate(outcomes) if error is not None}
+        summary = aggregate(calls, results)
+        return BatchResult(
+            summary=summary, call_types=[kind for kind, _, _ in calls],
+            call_seconds=[seconds for _, _, seconds in outcomes], fanout_seconds=fanout, errors=errors,
+            raw_response_tokens=sum(RESPONSE_CACHE.envelope_tokens(tool)
+                                    for (_, tool, _), data in zip(calls, results) if data is not None),
+            summary_tokens=count_tokens(get_wire_format().encode(summary))
+        )
+
+
+def execute_batch(batch: dict = BATCH_REQUEST, server: Optional[MCPServer] = None) -> BatchResult:
+    """Synchronous wrapper: execute one batch intent."""
+    return asyncio.run(SandboxExecutor(server).execute(batch))
+
+
+def _percentiles(values: list[float]) -> dict:
+    ordered = sorted(values)
+
+    def at(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3) if ordered else 0.0
+    return {"p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": at(1.0)}
+
+
+async def run_sandbox_benchmark(batches: int = 100, concurrency: int = 1, batch: dict = BATCH_REQUEST,
+                                server: Optional[MCPServer] = None) -> dict:
+    """Execute `batches` batch intents with up to `concurrency` in flight; latency, throughput and tokens."""
+    executor = SandboxExecutor(server)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one() -> BatchResult:
+        async with limit:
+            return await executor.execute(batch)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(batches)))
+    elapsed = time.perf_counter() - start
+    calls = [s for r in results for s in r.call_seconds]
+    fanout = [r.fanout_seconds for r in results]
+    sequential = [sum(r.call_seconds) for r in results]
+    last = results[-1]
+    return {
+        "batches": batches, "concurrency": concurrency, "calls_per_batch": len(last.call_seconds),
+        "errors": sum(len(r.errors) for r in results),
+        "fanout_latency": _percentiles(fanout),
+        "call_latency": _percentiles(calls),
+        "sequential_equivalent_ms": round(sum(sequential) / len(sequential) * 1000, 3),
+        "fanout_speedup": round(sum(sequential) / sum(fanout), 2) if sum(fanout) > 0 else 0,
+        "throughput": {"batches_per_second": round(batches / elapsed, 1),
+                       "tool_calls_per_second": round(len(calls) / elapsed, 1)},
+        "tokens": {"summary_tokens": last.summary_tokens, "raw_response_tokens": last.raw_response_tokens,
+                   "canned_summary_tokens": count_tokens(get_wire_format().encode(AGGREGATED_RESPONSE)),
+                   "reduction_percentage": (round((1 - last.summary_tokens / last.raw_response_tokens) * 100, 2)
+                                            if last.raw_response_tokens else 0.0)},
+        "summary": last.summary
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from code_execution import run_code_execution_simulation
+    from traditional_mcp import TRAVEL_OPERATIONS
+
+    parser = argparse.ArgumentParser(description="Execute code-execution batch intents against the mock tools")
+    parser.add_argument("--latency", type=float, default=0.05, help="Per-call latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform ± jitter in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1, help="Batches in flight at once")
+    parser.add_argument("--wire-format", choices=sorted(WIRE_FORMATS), default="json",
+                        help="Encoding of tool results and the returned summary")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+    set_wire_format(args.wire_format)
+
+    server = MCPServer(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    result = asyncio.run(run_sandbox_benchmark(args.batches, args.concurrency, server=server))
+    measured = run_code_execution_simulation(TRAVEL_OPERATIONS, batch_response=result["summary"]).grand_total
+    canned = run_code_execution_simulation(TRAVEL_OPERATIONS).grand_total
+    result["code_execution_grand_total"] = {"executed": measured, "canned": canned}
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        fan, call, tokens = result["fanout_latency"], result["call_latency"], result["tokens"]
+        print(f"Executed {result['batches']} batches × {result['calls_per_batch']} calls "
+              f"(concurrency {result['concurrency']}, {result['errors']} errors)")
+        print(f"  Fan-out latency:  p50 {fan['p50_ms']} ms | p95 {fan['p95_ms']} ms | p99 {fan['p99_ms']} ms | "
+              f"max {fan['max_ms']} ms")
+        print(f"  Per-call latency: p50 {call['p50_ms']} ms | p95 {call['p95_ms']} ms | max {call['max_ms']} ms")
+        print(f"  Sequential equivalent: {result['sequential_equivalent_ms']} ms/batch "
+              f"({result['fanout_speedup']}x fan-out speedup)")
+        print(f"  Throughput: {result['throughput']['batches_per_second']} batches/s, "
+              f"{result['throughput']['tool_calls_per_second']} tool calls/s")
+        print(f"  Tokens to model: {tokens['summary_tokens']} (raw responses {tokens['raw_response_tokens']}, "
+              f"{tokens['reduction_percentage']}% reduction; canned summary {tokens['canned_summary_tokens']})")
+        print(f"  Code execution grand total: {measured:,} executed vs {canned:,} canned")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+N×M scenario sweep for the MCP token experiment.
+
+Runs both paradigms over a grid of synthetic tool catalogs (N tools) and
+operation lists (M operations) across a process pool, streaming one JSON
+summary line per grid cell as soon as it finishes. The code-execution side
+discovers the cell's tools in its catalog and batches its operations (see
+code_execution.run_code_execution_simulation), so both paradigms vary with
+N and M. With --cache-dir, cells
+are read back from result_cache and only cells whose inputs changed are
+recomputed. With --store, cells are also appended to the results store
+(results_store.py) as one run, in batched transactions. With --token-store,
+every worker shares the memory-mapped token cache (token_store.py).
+
+Run with: python sweep.py --tools 5,50,500,5000 --ops 1,10,100,1000
+"""
+from __future__ import annotations
+import inspect
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_mcp_server import TRAVEL_MCP_TOOLS, ToolRegistry, generate_tool_catalog
+from traditional_mcp import run_traditional_simulation, TRAVEL_OPERATIONS
+from code_execution import run_code_execution_simulation
+from analysis import compare_paradigms
+from token_estimation import get_estimator
+from result_cache import DEFAULT_CACHE_DIR, ResultStore, cached_comparison, digest
+from results_store import DEFAULT_DB, ResultsStore
+from token_counter import set_persistent_store
+from token_store import DEFAULT_TOKEN_STORE_DIR
+
+DEFAULT_TOOL_COUNTS = (5, 10, 50, 100, 500, 1000, 5000)
+DEFAULT_OP_COUNTS = (1, 5, 10, 50, 100, 500, 1000)
+STORE_BATCH = 1000  # Cells per results-store transaction
+
+
+def generate_operations(m: int) -> list[dict]:
+    """Build m operations by cycling through the travel planning operations."""
+    return [TRAVEL_OPERATIONS[i % len(TRAVEL_OPERATIONS)] for i in range(m)]
+
+
+@lru_cache(maxsize=None)
+def _catalog_key(n_tools: int) -> str:
+    # A generated catalog is determined by the travel tools, N and the generator
+    return digest("generate_tool_catalog", n_tools, [t.to_schema() for t in TRAVEL_MCP_TOOLS],
+                  inspect.getsource(generate_tool_catalog))
+
+
+def run_cell(n_tools: int, n_ops: int, exact: bool = False, cache_dir: Optional[str] = None) -> dict:
+    """Run both paradigms for one grid cell and return its summary (reusing cached results if cache_dir)."""
+    start = time.perf_counter()
+    operations = generate_operations(n_ops)
+    tools = generate_tool_catalog(n_tools)
+    if cache_dir is not None:
+        comparison = cached_comparison(operations, tools, exact, ResultStore(cache_dir), _catalog_key(n_tools))
+    else:
+        estimator = None if exact else get_estimator()
+        registry = ToolRegistry(tools)
+        comparison = compare_paradigms(run_traditional_simulation(operations, registry, estimator),
+                                       run_code_execution_simulation(operations, tools=registry))
+    return {
+        "n_tools": n_tools, "n_operations": n_ops, "exact": exact,
+        "traditional": comparison["traditional"], "code_execution": comparison["code_execution"],
+        "comparison": comparison["comparison"],
+        "elapsed_seconds": round(time.perf_counter() - start, 4)
+    }
+
+
+def run_sweep(tool_counts: list[int], op_counts: list[int],
+              workers: Optional[int] = None, exact: bool = False,
+              cache_dir: Optional[str] = None) -> Iterator[dict]:
+    """Yield per-cell summaries in completion order."""
+    # Largest catalogs first so the slowest cells don't trail at the end
+    cells = sorted(((n, m) for n in tool_counts for m in op_counts), key=lambda c: -c[0] * c[1])
+    if workers == 1:
+        for n, m in cells:
+            yield run_cell(n, m, exact, cache_dir)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_cell, n, m, exact, cache_dir) for n, m in cells]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _parse_counts(value: str) -> list[int]:
+    counts = [int(v) for v in value.split(",") if v.strip()]
+    if not counts or min(counts) < 1:
+        raise ValueError(f"expected comma-separated positive integers, got {value!r}")
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sweep MCP token consumption over an N×M grid")
+    parser.add_argument("--tools", type=_parse_counts, default=list(DEFAULT_TOOL_COUNTS),
+                        help="Comma-separated tool catalog sizes (N)")
+    parser.add_argument("--ops", type=_parse_counts, default=list(DEFAULT_OP_COUNTS),
+                        help="Comma-separated operation counts (M)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", help="Write JSON lines here instead of stdout")
+    parser.add_argument("--exact", action="store_true",
+                        help="Count every tool call exactly instead of using the compositional estimator")
+    parser.add_argument("--cache-dir", nargs="?", const=DEFAULT_CACHE_DIR,
+                        help=f"Reuse results of unchanged cells from this directory (default {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_DB,
+                        help=f"Append the cells to this results database as one run (default {DEFAULT_DB})")
+    parser.add_argument("--token-store", nargs="?", const=DEFAULT_TOKEN_STORE_DIR,
+                        help=f"Share token counts across workers through this directory (default {DEFAULT_TOKEN_STORE_DIR})")
+
+    args = parser.parse_args()
+    if args.token_store:
+        os.environ["MCP_TOKEN_STORE"] = args.token_store  # For workers started with spawn
+        set_persistent_store(args.token_store)
+
+    total = len(args.tools) * len(args.ops)
+    out = open(args.output, "w") if args.output else sys.stdout
+    store = ResultsStore(args.store) if args.store else None
+    run_id = store.begin_run("sweep", args.exact) if store else None
+    pending = []
+    start = time.perf_counter()
+    try:
+        for done, cell in enumerate(run_sweep(args.tools, args.ops, args.workers, args.exact, args.cache_dir), 1):
+            out.write(json.dumps(cell) + "\n")
+            out.flush()
+            print(f"[{done}/{total}] N={cell['n_tools']} M={cell['n_operations']}: "
+                  f"{cell['comparison']['total_savings_percentage']}% savings", file=sys.stderr)
+            if store:
+                pending.append(cell)
+                if len(pending) >= STORE_BATCH:
+                    store.add_scenarios(run_id, pending)
+                    pending.clear()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store:
+            store.add_scenarios(run_id, pending)
+            store.close()
+            print(f"[Run {run_id} appended: {args.store}]", file=sys.stderr)
+    print(f"[Sweep complete: {total} cells in {time.perf_counter() - start:.1f}s]", file=sys.stderr)
@@ -5,20 +5,418 @@ Token counting utilities for MCP experiment.
 Uses tiktoken (OpenAI's tokenizer) as a proxy for token counting.
 """
 
-from dataclasses import dataclass, field
-from typing import Optional
-import tiktoken
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    import tiktoken
+    from token_store import TokenStore
 
 
 # Use cl100k_base encoding (GPT-4/Claude compatible)
-_encoder = tiktoken.get_encoding("cl100k_base")
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_CACHE_SIZE = 65536
+# Below this size, thread dispatch costs more than encoding under several encodings in turn
+PARALLEL_MIN_CHARS = 4096
+# Characters StreamingTokenCounter buffers before encoding
+DEFAULT_STREAM_CHUNK = 1 << 16
+# Pieces before a chunk cut re-split to confirm the cut is exact
+_STREAM_CHECK_PIECES = 4
 
 
-def count_tokens(text: str) -> int:
-    """Count tokens in a text string."""
+def get_encoder(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """Load a tiktoken encoding on first use (tiktoken caches loaded encodings)."""
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+
+def content_key(text: str) -> bytes:
+    """Stable content hash used as the cache key (avoids retaining large strings)."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss/eviction counters for a token count cache."""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+    max_size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": self.size,
+            "max_size": self.max_size,
+            "hit_rate": round(self.hit_rate, 4)
+        }
+
+
+class TokenCounter:
+    """Token counting engine with a bounded, content-hash-keyed LRU cache.
+    
+    An attached TokenStore (see set_persistent_store) backs the LRU: misses are
+    looked up on disk before encoding, and new counts are written through.
+    """
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, max_size: int = DEFAULT_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self.max_size = max_size
+        self.store: Optional[TokenStore] = None
+        self._encoder: Optional[tiktoken.Encoding] = None
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = self._evictions = 0
+
+    @property
+    def encoder(self) -> tiktoken.Encoding:
+        """The underlying encoding, loaded on first access."""
+        if self._encoder is None:
+            self._encoder = get_encoder(self.encoding_name)
+        return self._encoder
+
+    def _lookup(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return n
+            self._misses += 1
+        if self.store is not None:
+            n = self.store.get(key)
+            if n is not None:
+                self._remember(key, n)
+        return n
+
+    def _store(self, key: bytes, n: int, tokens: Optional[list[int]] = None) -> None:
+        """Cache a freshly encoded count (written through to the attached store)."""
+        self._remember(key, n)
+        if self.store is not None:
+            self.store.put(key, n, tokens)
+
+    def _remember(self, key: bytes, n: int) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = n
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+
+    def count(self, text: str, key: Optional[bytes] = None) -> int:
+        """Count tokens in a text string, reusing cached counts."""
+        if not text:
+            return 0
+        if key is None:
+            key = content_key(text)
+        n = self._lookup(key)
+        if n is None:
+            tokens = self.encoder.encode(text)
+            n = len(tokens)
+            self._store(key, n, tokens)
+        return n
+
+    def count_many(self, texts: Iterable[str]) -> list[int]:
+        """Count tokens for many strings; cache misses go through the batch encoder."""
+        texts = list(texts)
+        counts = [0] * len(texts)
+        pending: dict[bytes, list[int]] = {}
+        pending_text: list[str] = []
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            key = content_key(text)
+            if key in pending:
+                pending[key].append(i)
+                continue
+            n = self._lookup(key)
+            if n is None:
+                pending[key] = [i]
+                pending_text.append(text)
+            else:
+                counts[i] = n
+        if len(pending_text) == 1:
+            encoded = [self.encoder.encode(pending_text[0])]
+        elif pending_text:
+            encoded = self.encoder.encode_batch(pending_text)
+        else:
+            encoded = []
+        for (key, idxs), tokens in zip(pending.items(), encoded):
+            self._remember(key, len(tokens))
+            for i in idxs:
+                counts[i] = len(tokens)
+        if self.store is not None and encoded:
+            self.store.put_many((key, len(tokens), tokens) for key, tokens in zip(pending, encoded))
+        return counts
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions, len(self._cache), self.max_size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._hits = self._misses = self._evictions = 0
+
+
+class TokenCount(int):
+    """Token count under the primary encoding that also carries counts under other encodings.
+    
+    Behaves as a plain int (the primary count). `+` and `//` between TokenCounts
+    combine `by_encoding` element-wise, so totals built by the simulations stay
+    per-encoding; mixing in a non-zero plain int, and any other arithmetic,
+    yields a plain int. Code deriving counts otherwise (e.g. the estimator)
+    builds the per-encoding TokenCount itself.
+    """
+    
+    def __new__(cls, value: int, by_encoding: dict[str, int]):
+        obj = super().__new__(cls, value)
+        obj.by_encoding = by_encoding
+        return obj
+    
+    def __add__(self, other):
+        if isinstance(other, TokenCount):
+            return TokenCount(int(self) + int(other),
+                              {k: v + other.by_encoding.get(k, 0) for k, v in self.by_encoding.items()})
+        if isinstance(other, int) and other == 0:
+            return self
+        return int(self) + other
+    
+    __radd__ = __add__
+    
+    def __floordiv__(self, other):
+        if isinstance(other, int):
+            return TokenCount(int(self) // other, {k: v // other for k, v in self.by_encoding.items()})
+        return int(self) // other
+    
+    def __reduce__(self):
+        return (TokenCount, (int(self), self.by_encoding))
+
+
+_counter = TokenCounter()
+_counters: dict[str, TokenCounter] = {DEFAULT_ENCODING: _counter}
+_encodings: tuple[str, ...] = (DEFAULT_ENCODING,)
+_epoch = 0
+_pool: Optional[ThreadPoolExecutor] = None
+_store_root: Optional[str] = None
+_store_ids = False
+
+
+def set_encodings(*encoding_names: str) -> None:
+    """Count under these encodings (the first is primary); one name restores plain int counts."""
+    global _counter, _counters, _encodings, _epoch, _pool
+    names = tuple(dict.fromkeys(encoding_names)) or (DEFAULT_ENCODING,)
+    _counters = {name: _counters.get(name) or TokenCounter(name) for name in names}
+    for counter in _counters.values():
+        if _store_root is not None and counter.store is None:
+            _attach_store(counter)
+    _counter = _counters[names[0]]
+    _encodings = names
+    _epoch += 1
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+def _attach_store(counter: TokenCounter) -> None:
+    from token_store import TokenStore
+    counter.store = None if _store_root is None else TokenStore(_store_root, counter.encoding_name, _store_ids)
+
+
+def set_persistent_store(root: Optional[str], store_ids: bool = False) -> None:
+    """Back every TokenCounter with the memory-mapped TokenStore in root (None detaches).
+    
+    Worker processes inherit it when forked; spawned ones attach via MCP_TOKEN_STORE=<root>.
+    """
+    global _store_root, _store_ids
+    _store_root, _store_ids = root, store_ids
+    for counter in _counters.values():
+        _attach_store(counter)
+
+
+def persistent_stores() -> list[TokenStore]:
+    """The TokenStores attached to the active counters (empty when none is set)."""
+    return [c.store for c in _counters.values() if c.store is not None]
+
+
+def active_encodings() -> tuple[str, ...]:
+    return _encodings
+
+
+def encoding_epoch() -> int:
+    """Changes whenever the active encodings change; include it in keys of cached counts."""
+    return _epoch
+
+
+def _thread_pool() -> ThreadPoolExecutor:
+    # tiktoken releases the GIL while encoding, so encoders run truly in parallel
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=len(_encodings), thread_name_prefix="tokenizer")
+    return _pool
+
+
+def count_tokens_multi(text: str) -> dict[str, int]:
+    """Count one text under every active encoding, hashing it once; large misses encode concurrently."""
     if not text:
-        return 0
-    return len(_encoder.encode(text))
+        return {name: 0 for name in _encodings}
+    key = content_key(text)
+    counts = {}
+    missing = []
+    for name, counter in _counters.items():
+        n = counter._lookup(key)
+        if n is None:
+            missing.append(counter)
+        else:
+            counts[name] = n
+    if len(missing) > 1 and len(text) >= PARALLEL_MIN_CHARS:
+        encoded = _thread_pool().map(lambda c: c.encoder.encode(text), missing)
+    else:
+        encoded = (c.encoder.encode(text) for c in missing)
+    for counter, tokens in zip(missing, encoded):
+        counter._store(key, len(tokens), tokens)
+        counts[counter.encoding_name] = len(tokens)
+    return {name: counts[name] for name in _encodings}
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in a text string (a TokenCount when several encodings are active)."""
+    if len(_encodings) == 1:
+        return _counter.count(text)
+    counts = count_tokens_multi(text)
+    return TokenCount(counts[_encodings[0]], counts)
+
+
+def count_tokens_many(texts: Iterable[str]) -> list[int]:
+    """Count tokens for each string in a batch, preserving order."""
+    if len(_encodings) == 1:
+        return _counter.count_many(texts)
+    texts = list(texts)
+    counters = list(_counters.values())
+    if sum(len(t) for t in texts) >= PARALLEL_MIN_CHARS:
+        per_encoding = list(_thread_pool().map(lambda c: c.count_many(texts), counters))
+    else:
+        per_encoding = [c.count_many(texts) for c in counters]
+    return [TokenCount(row[0], dict(zip(_encodings, row))) for row in zip(*per_encoding)]
+
+
+class StreamingTokenCounter:
+    """Exact token count of text fed in chunks, buffering about chunk_size characters.
+    
+    BPE merges never cross the encoding's pre-tokenizer pieces, so buffered
+    text is encoded up to a piece boundary and the rest is carried into the
+    next chunk. The cut leaves the last two pieces in the buffer and is only
+    taken if the few pieces before it split the same way without the text
+    after it (end-of-text anchors in the pattern can merge them); otherwise
+    it moves back one piece. Memory is bounded by chunk_size
+    plus the longest single piece. Counts are not cached.
+    """
+    
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, chunk_size: int = DEFAULT_STREAM_CHUNK):
+        self.encoding_name = encoding_name
+        self.chunk_size = chunk_size
+        self._encoder: Optional[tiktoken.Encoding] = None
+        self._pattern = None
+        self._parts: list[str] = []
+        self._buffered = 0
+        self.total = 0
+    
+    def _safe_cut(self, buf: str, pos: int, end: int) -> int:
+        while True:
+            tail = deque(self._pattern.finditer(buf, pos, end), maxlen=_STREAM_CHECK_PIECES + 2)
+            if len(tail) < _STREAM_CHECK_PIECES + 2:
+                return pos
+            cut = tail[-2].start()
+            # The pieces before the cut must split identically once the text after it is gone
+            expected = [m.span() for m in list(tail)[:-2]]
+            if [m.span() for m in self._pattern.finditer(buf, expected[0][0], cut)] == expected:
+                return cut
+            end = cut
+    
+    def _drain(self, final: bool = False) -> None:
+        if self._encoder is None:
+            import regex  # tiktoken's own dependency; supports its \p{..} patterns
+            self._encoder = get_encoder(self.encoding_name)
+            self._pattern = regex.compile(self._encoder._pat_str)
+        buf = "".join(self._parts)
+        pos = 0
+        while len(buf) - pos >= self.chunk_size:
+            cut = self._safe_cut(buf, pos, pos + self.chunk_size)
+            if cut == pos:  # One piece spans the whole window; wait for more text
+                break
+            self.total += len(self._encoder.encode(buf[pos:cut]))
+            pos = cut
+        if final and pos < len(buf):
+            self.total += len(self._encoder.encode(buf[pos:]))
+            pos = len(buf)
+        rest = buf[pos:]
+        self._parts = [rest] if rest else []
+        self._buffered = len(rest)
+    
+    def feed(self, text: str) -> None:
+        if not text:
+            return
+        self._parts.append(text)
+        self._buffered += len(text)
+        if self._buffered >= 2 * self.chunk_size:
+            self._drain()
+    
+    def finish(self) -> int:
+        """Encode whatever is buffered and return the total."""
+        self._drain(final=True)
+        return self.total
+
+
+def count_tokens_stream(chunks: Iterable[str], chunk_size: int = DEFAULT_STREAM_CHUNK) -> int:
+    """Exact token count of the concatenated chunks (e.g. from JSONEncoder.iterencode) in bounded memory.
+    
+    Equal to count_tokens("".join(chunks)), including a TokenCount when several encodings are active.
+    """
+    counters = [StreamingTokenCounter(name, chunk_size) for name in _encodings]
+    for chunk in chunks:
+        for counter in counters:
+            counter.feed(chunk)
+    totals = [counter.finish() for counter in counters]
+    if len(totals) == 1:
+        return totals[0]
+    return TokenCount(totals[0], dict(zip(_encodings, totals)))
+
+
+def count_json_tokens(obj, indent: Optional[int] = 2, chunk_size: int = DEFAULT_STREAM_CHUNK) -> int:
+    """Token count of json.dumps(obj, indent=indent) without building the string."""
+    import json
+    return count_tokens_stream(json.JSONEncoder(indent=indent).iterencode(obj), chunk_size)
+
+
+def token_cache_stats() -> CacheStats:
+    """Return hit/miss/eviction stats for the shared token count cache (primary encoding)."""
+    return _counter.stats()
+
+
+def clear_token_cache() -> None:
+    """Drop all in-memory cached token counts and reset the stats.
+    
+    A persistent store stays attached and keeps its counts; detach it with
+    set_persistent_store(None) to measure cold encoding.
+    """
+    for counter in _counters.values():
+        counter.clear()
 
 
 @dataclass
@@ -44,60 +442,178 @@ class TokenMetrics:
         }
 
 
-@dataclass
 class TokenAccumulator:
-    """Accumulates token metrics across multiple operations."""
+    """Accumulates token metrics across multiple operations.
+
+    Per-operation metrics live in compact typed arrays and category totals are
+    kept as running sums, so every total is O(1). A prefix-sum array of
+    per-operation totals supports O(1) cumulative and window queries. The
+    constructor keeps its original (paradigm_name, operations,
+    initial_context_tokens) order; record further operations with add_operation.
+    """
+    
+    def __init__(self, paradigm_name: str, operations: Iterable[TokenMetrics] = (), initial_context_tokens: int = 0):
+        self.paradigm_name = paradigm_name
+        self.initial_context_tokens = initial_context_tokens
+        self._context, self._reasoning, self._tool_call, self._response = (array("q") for _ in range(4))
+        self._prefix = array("q", [0])
+        self._sum_context = self._sum_reasoning = self._sum_tool_call = self._sum_response = 0
+        # Per-encoding running [context, reasoning, tool_call, response] sums, kept while every
+        # non-zero metric is a TokenCount (a plain int disables them)
+        self._by_encoding: Optional[dict[str, list[int]]] = None
+        self._encodings_complete = True
+        for metrics in operations:
+            self.add_operation(metrics)
     
-    paradigm_name: str
-    operations: list[TokenMetrics] = field(default_factory=list)
-    initial_context_tokens: int = 0
+    def __repr__(self) -> str:
+        return (f"TokenAccumulator(paradigm_name={self.paradigm_name!r}, "
+                f"initial_context_tokens={self.initial_context_tokens}, operations={len(self._context)})")
+    
+    def _add_by_encoding(self, values: tuple) -> None:
+        for i, v in enumerate(values):
+            if isinstance(v, TokenCount):
+                if self._by_encoding is None:
+                    self._by_encoding = {name: [0, 0, 0, 0] for name in v.by_encoding}
+                for name, sums in self._by_encoding.items():
+                    sums[i] += v.by_encoding.get(name, 0)
+            elif v:
+                self._encodings_complete = False
+                self._by_encoding = None
+                return
     
     def add_operation(self, metrics: TokenMetrics) -> None:
         """Add metrics from a single operation."""
-        self.operations.append(metrics)
+        values = (metrics.context_tokens, metrics.reasoning_tokens, metrics.tool_call_tokens, metrics.response_tokens)
+        if self._encodings_complete:
+            self._add_by_encoding(values)
+        # Running sums track the primary encoding as plain ints
+        context, reasoning, tool_call, response = map(int, values)
+        self._context.append(context)
+        self._reasoning.append(reasoning)
+        self._tool_call.append(tool_call)
+        self._response.append(response)
+        self._sum_context += context
+        self._sum_reasoning += reasoning
+        self._sum_tool_call += tool_call
+        self._sum_response += response
+        self._prefix.append(self._prefix[-1] + context + reasoning + tool_call + response)
+    
+    def merge(self, other: TokenAccumulator) -> None:
+        """Append all operations (and initial context) recorded by another accumulator."""
+        base = self._prefix[-1]
+        self.initial_context_tokens += other.initial_context_tokens
+        self._context.extend(other._context)
+        self._reasoning.extend(other._reasoning)
+        self._tool_call.extend(other._tool_call)
+        self._response.extend(other._response)
+        self._prefix.extend(base + v for v in other._prefix[1:])
+        self._sum_context += other._sum_context
+        self._sum_reasoning += other._sum_reasoning
+        self._sum_tool_call += other._sum_tool_call
+        self._sum_response += other._sum_response
+        if not (self._encodings_complete and other._encodings_complete):
+            self._encodings_complete, self._by_encoding = False, None
+        elif other._by_encoding is not None:
+            if self._by_encoding is None:
+                self._by_encoding = {name: [0, 0, 0, 0] for name in other._by_encoding}
+            for name, sums in self._by_encoding.items():
+                for i, v in enumerate(other._by_encoding.get(name, (0, 0, 0, 0))):
+                    sums[i] += v
+    
+    def operation(self, index: int) -> TokenMetrics:
+        """Rebuild the metrics recorded for a single operation."""
+        return TokenMetrics(self._context[index], self._reasoning[index],
+                            self._tool_call[index], self._response[index])
+    
+    @property
+    def operations(self) -> tuple[TokenMetrics, ...]:
+        """All recorded operations as TokenMetrics (a read-only snapshot, materialized on demand, O(M))."""
+        return tuple(self.operation(i) for i in range(len(self._context)))
+    
+    def cumulative_tokens(self, k: int) -> int:
+        """Total tokens consumed after the first k operations, including initial context."""
+        if not 0 <= k <= self.operation_count:
+            raise IndexError(f"operation count {k} out of range 0..{self.operation_count}")
+        return int(self.initial_context_tokens) + self._prefix[k]
+    
+    def window_tokens(self, start: int, end: int) -> int:
+        """Tokens consumed by operations in the half-open range [start, end)."""
+        if not 0 <= start <= end <= self.operation_count:
+            raise IndexError(f"window [{start}, {end}) out of range 0..{self.operation_count}")
+        return self._prefix[end] - self._prefix[start]
     
     @property
     def total_context_tokens(self) -> int:
         """Total context tokens (initial + per-operation)."""
-        return self.initial_context_tokens + sum(m.context_tokens for m in self.operations)
+        return self.initial_context_tokens + self._sum_context
     
     @property
     def total_reasoning_tokens(self) -> int:
-        return sum(m.reasoning_tokens for m in self.operations)
+        return self._sum_reasoning
     
     @property
     def total_tool_call_tokens(self) -> int:
-        return sum(m.tool_call_tokens for m in self.operations)
+        return self._sum_tool_call
     
     @property
     def total_response_tokens(self) -> int:
-        return sum(m.response_tokens for m in self.operations)
+        return self._sum_response
     
     @property
     def grand_total(self) -> int:
-        return (self.total_context_tokens + self.total_reasoning_tokens +
-                self.total_tool_call_tokens + self.total_response_tokens)
+        return int(self.initial_context_tokens) + self._prefix[-1]
     
     @property
     def operation_count(self) -> int:
-        return len(self.operations)
+        return len(self._context)
     
     @property
     def tokens_per_operation(self) -> float:
-        if not self.operations:
+        if not self.operation_count:
             return 0.0
-        return self.grand_total / len(self.operations)
+        return self.grand_total / self.operation_count
+    
+    def totals_by_encoding(self) -> Optional[dict[str, dict]]:
+        """Per-encoding totals when every count carried all active encodings, else None."""
+        initial = self.initial_context_tokens
+        if not self._encodings_complete or (initial and not isinstance(initial, TokenCount)):
+            return None
+        names = list(self._by_encoding or getattr(initial, "by_encoding", {}))
+        if len(names) < 2:
+            return None
+        out = {}
+        for name in names:
+            ctx, reasoning, tool_call, response = (self._by_encoding or {}).get(name, (0, 0, 0, 0))
+            init = initial.by_encoding.get(name, 0) if isinstance(initial, TokenCount) else 0
+            out[name] = {
+                "initial_context_tokens": init,
+                "total_context_tokens": init + ctx,
+                "total_reasoning_tokens": reasoning,
+                "total_tool_call_tokens": tool_call,
+                "total_response_tokens": response,
+                "grand_total": init + ctx + reasoning + tool_call + response
+            }
+        return out
     
     def summary(self) -> dict:
         """Return summary of all token metrics."""
-        return {
+        grand_total, count = self.grand_total, self.operation_count
+        summary = {
             "paradigm": self.paradigm_name,
-            "operation_count": self.operation_count,
-            "initial_context_tokens": self.initial_context_tokens,
-            "total_context_tokens": self.total_context_tokens,
-            "total_reasoning_tokens": self.total_reasoning_tokens,
-            "total_tool_call_tokens": self.total_tool_call_tokens,
-            "total_response_tokens": self.total_response_tokens,
-            "grand_total": self.grand_total,
-            "tokens_per_operation": round(self.tokens_per_operation, 2)
+            "operation_count": count,
+            "initial_context_tokens": int(self.initial_context_tokens),
+            "total_context_tokens": int(self.total_context_tokens),
+            "total_reasoning_tokens": self._sum_reasoning,
+            "total_tool_call_tokens": self._sum_tool_call,
+            "total_response_tokens": self._sum_response,
+            "grand_total": grand_total,
+            "tokens_per_operation": round(grand_total / count if count else 0.0, 2)
         }
+        by_encoding = self.totals_by_encoding()
+        if by_encoding:
+            summary["by_encoding"] = by_encoding
+        return summary
+
+
+if os.environ.get("MCP_TOKEN_STORE"):
+    set_persistent_store(os.environ["MCP_TOKEN_STORE"], os.environ.get("MCP_TOKEN_STORE_IDS") == "1")
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Persistent memory-mapped token cache shared across worker processes.
+
+Each encoding has one table file (<root>/<encoding>.tokens): an
+open-addressing hash table of 32-byte slots holding a text's content_key,
+its token count and, when token IDs are kept, their offset in
+<encoding>.ids (a flat uint32 array). Readers probe the memory-mapped table
+in place, without copying it and without locks. Writers serialize on an
+flock of <encoding>.lock: token IDs are appended first, then the count and
+offset, and finally the key that publishes the slot. At 70% load the table
+is rebuilt at twice the size and swapped in with os.replace; readers keep
+their old mapping and remap when a lookup misses.
+
+token_counter.set_persistent_store() (or MCP_TOKEN_STORE=<dir> in the
+environment, e.g. for spawned workers) puts a store behind every
+TokenCounter: LRU misses are looked up here before encoding and new counts
+are written through. `warm` pre-populates it from TRAVEL_MCP_TOOLS,
+MOCK_RESPONSES, generated catalogs and tool catalog files.
+
+Run with: python token_store.py warm --tools 5,50,500,5000
+          python token_store.py stats
+          python token_store.py check --processes 4
+"""
+from __future__ import annotations
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # No cross-process locking; a single writer process is still safe
+    fcntl = None
+
+DEFAULT_TOKEN_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".token_store")
+DEFAULT_CAPACITY = 1 << 16  # Slots in a new table (a power of two)
+MAX_LOAD = 0.7
+
+_MAGIC = b"MCPTOK01"
+_HEADER = struct.Struct("<8sQQ")  # magic, capacity, used
+_HEADER_SIZE = 64
+_SLOT_SIZE = 32                   # key (16 bytes) + _TAIL
+_TAIL = struct.Struct("<IIQ")     # count, flags, token ID offset (in tokens)
+_HAS_IDS = 1
+_EMPTY = bytes(16)
+
+
+class TokenStore:
+    """On-disk content_key -> token count table (plus optional token IDs) for one encoding.
+    
+    With readonly, an existing table is mapped read-only (FileNotFoundError if there is none).
+    """
+
+    def __init__(self, root: str, encoding_name: str, store_ids: bool = False, capacity: int = DEFAULT_CAPACITY,
+                 readonly: bool = False):
+        self.root = root
+        self.encoding_name = encoding_name
+        self.store_ids = store_ids
+        self.readonly = readonly
+        base = os.path.join(root, encoding_name)
+        self._path, self._ids_path, self._lock_path = base + ".tokens", base + ".ids", base + ".lock"
+        self._lock = threading.Lock()
+        self._lock_fd: Optional[int] = None
+        self._lock_pid: Optional[int] = None
+        self._ids: Optional[mmap.mmap] = None
+        self.hits = self.misses = self.writes = 0
+        if readonly:
+            if not os.path.exists(self._path):
+                raise FileNotFoundError(f"no {encoding_name} token store in {root}")
+            self._map()
+            return
+        os.makedirs(root, exist_ok=True)
+        if not os.path.exists(self._path):
+            with self._locked():
+                if not os.path.exists(self._path):
+                    self._create(1 << max(4, (capacity - 1).bit_length()), [])
+        self._map()
+
+    # --- file management -----------------------------------------------------
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_pid != os.getpid():  # A forked child must not share the parent's lock
+                self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _map(self) -> None:
+        with open(self._path, "rb" if self.readonly else "r+b") as f:
+            table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE)
+            self._ino = os.fstat(f.fileno()).st_ino
+        magic, capacity, _ = _HEADER.unpack_from(table, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{self._path} is not a token store")
+        # Mappings being replaced are left to the garbage collector; concurrent readers may still hold them
+        self._table, self._mask = table, capacity - 1
+
+    def _stale(self) -> bool:
+        try:
+            return os.stat(self._path).st_ino != self._ino
+        except FileNotFoundError:
+            return False
+
+    def _create(self, capacity: int, entries: Iterable[tuple[bytes, bytes]]) -> None:
+        """Write a table with the given (key, tail) entries to a temp file and swap it in."""
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "r+b") as f:
+                f.truncate(_HEADER_SIZE + capacity * _SLOT_SIZE)
+                table = mmap.mmap(f.fileno(), 0)
+                used = 0
+                for key, tail in entries:
+                    offset, _ = _probe(table, capacity - 1, key)
+                    table[offset + 16:offset + _SLOT_SIZE] = tail
+                    table[offset:offset + 16] = key
+                    used += 1
+                _HEADER.pack_into(table, 0, _MAGIC, capacity, used)
+                table.flush()
+                table.close()
+            os.replace(tmp, self._path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def _entries(self) -> Iterator[tuple[bytes, bytes]]:
+        table = self._table
+        for offset in range(_HEADER_SIZE, len(table), _SLOT_SIZE):
+            key = table[offset:offset + 16]
+            if key != _EMPTY:
+                yield key, table[offset + 16:offset + _SLOT_SIZE]
+
+    # --- lookups ---------------------------------------------------------------
+
+    def _find(self, key: bytes) -> Optional[int]:
+        offset, found = _probe(self._table, self._mask, key)
+        if not found and self._stale():
+            self._map()
+            offset, found = _probe(self._table, self._mask, key)
+        return offset if found else None
+
+    def get(self, key: bytes) -> Optional[int]:
+        """Token count stored for a content_key, or None."""
+        offset = self._find(key)
+        if offset is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _TAIL.unpack_from(self._table, offset + 16)[0]
+
+    def get_ids(self, key: bytes) -> Optional[memoryview]:
+        """Stored token IDs as a zero-copy uint32 view, or None."""
+        offset = self._find(key)
+        if offset is None:
+            return None
+        count, flags, start = _TAIL.unpack_from(self._table, offset + 16)
+        if not flags & _HAS_IDS:
+            return None
+        end = (start + count) * 4
+        if self._ids is None or len(self._ids) < end:
+            with open(self._ids_path, "rb") as f:
+                self._ids = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._ids)[start * 4:end].cast("I")
+
+    def __contains__(self, key: bytes) -> bool:
+        return self._find(key) is not None
+
+    def __len__(self) -> int:
+        return _HEADER.unpack_from(self._table, 0)[2]
+
+    # --- appends ---------------------------------------------------------------
+
+    def put(self, key: bytes, count: int, ids: Optional[Iterable[int]] = None) -> None:
+        self.put_many([(key, count, ids)])
+
+    def put_many(self, items: Iterable[tuple[bytes, int, Optional[Iterable[int]]]]) -> int:
+        """Add (key, count, token IDs or None) entries not stored yet, under one lock; returns how many.
+        
+        Stored IDs are read back as `count` entries, so a count must match its ID list.
+        """
+        if self.readonly:
+            raise PermissionError(f"{self._path} is open read-only")
+        checked = []
+        for key, count, ids in items:
+            if ids is not None and self.store_ids:
+                ids = array("I", ids)
+                if len(ids) != count:
+                    raise ValueError(f"count {count} does not match {len(ids)} token IDs")
+            checked.append((key, count, ids))
+        items = checked
+        if not items:
+            return 0
+        with self._locked():
+            if self._stale():
+                self._map()
+            new, seen = [], set()
+            for key, count, ids in items:
+                if key not in seen and not _probe(self._table, self._mask, key)[1]:
+                    seen.add(key)
+                    new.append((key, count, ids))
+            if not new:
+                return 0
+            tails = []
+            ids_file = open(self._ids_path, "ab") if self.store_ids else None
+            try:
+                for key, count, ids in new:
+                    if ids_file is not None and ids is not None:
+                        tails.append(_TAIL.pack(count, _HAS_IDS, ids_file.tell() // 4))
+                        ids_file.write(ids.tobytes())
+                    else:
+                        tails.append(_TAIL.pack(count, 0, 0))
+            finally:
+                if ids_file is not None:
+                    ids_file.close()  # IDs reach the file before any slot points at them
+            used = len(self)
+            for (key, _, _), tail in zip(new, tails):
+                if used + 1 > MAX_LOAD * (self._mask + 1):
+                    self._create(2 * (self._mask + 1), self._entries())
+                    self._map()
+                offset, _ = _probe(self._table, self._mask, key)
+                self._table[offset + 16:offset + _SLOT_SIZE] = tail
+                self._table[offset:offset + 16] = key  # Publishes the slot
+                used += 1
+                _HEADER.pack_into(self._table, 0, _MAGIC, self._mask + 1, used)
+            self.writes += len(new)
+            return len(new)
+
+    def stats(self) -> dict:
+        ids_bytes = os.path.getsize(self._ids_path) if os.path.exists(self._ids_path) else 0
+        return {"encoding": self.encoding_name, "entries": len(self), "capacity": self._mask + 1,
+                "table_bytes": len(self._table), "ids_bytes": ids_bytes,
+                "hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+
+def _probe(table, mask: int, key: bytes) -> tuple[int, bool]:
+    """(slot offset, found): the slot holding key, else the empty slot where it would go."""
+    i = int.from_bytes(key[:8], "little") & mask
+    while True:
+        offset = _HEADER_SIZE + i * _SLOT_SIZE
+        slot = table[offset:offset + 16]
+        if slot == key:
+            return offset, True
+        if slot == _EMPTY:
+            return offset, False
+        i = (i + 1) & mask
+
+
+def _self_test_worker(root: str, seed: int, entries: int) -> int:
+    import hashlib
+    import random
+    store = TokenStore(root, "selftest", store_ids=True, capacity=16)
+    rng = random.Random(seed)
+    for _ in range(entries):
+        i = rng.randrange(entries)
+        key = hashlib.blake2b(str(i).encode(), digest_size=16).digest()
+        ids = list(range(i, i + i % 7 + 1))
+        store.put(key, len(ids), ids)
+        if store.get(key) != len(ids) or list(store.get_ids(key)) != ids:
+            raise AssertionError(f"entry {i} read back wrong in worker {seed}")
+    return store.writes
+
+
+def self_test(processes: int = 4, entries: int = 2000) -> dict:
+    """Concurrent put/get from several processes into a fresh 16-slot store (so it grows while
+    they append); raises AssertionError if any count or ID array reads back wrong."""
+    import hashlib
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    with tempfile.TemporaryDirectory() as root:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            writes = sum(pool.map(partial(_self_test_worker, root, entries=entries), range(processes)))
+        store = TokenStore(root, "selftest", readonly=True)
+        found = 0
+        for i in range(entries):
+            key = hashlib.blake2b(str(i).encode(), digest_size=16).digest()
+            if key in store:
+                found += 1
+                if list(store.get_ids(key)) != list(range(i, i + i % 7 + 1)):
+                    raise AssertionError(f"entry {i} read back wrong after all writers finished")
+        if found != len(store) or writes != len(store):
+            raise AssertionError(f"{len(store)} entries, {found} found, {writes} written")
+        return {"processes": processes, "entries": len(store), "capacity": store.stats()["capacity"]}
+
+
+def warm(tool_counts: Iterable[int] = (), catalogs: Iterable[str] = (), estimator: bool = True) -> dict:
+    """Tokenize the travel tools, mock responses, generated and file catalogs through the attached stores."""
+    import json
+    from token_counter import count_tokens_many
+    from mock_mcp_server import (MCPTool, ToolRegistry, MOCK_RESPONSES, RESPONSE_CACHE, TRAVEL_REGISTRY,
+                                 generate_tool_catalog)
+    from traditional_mcp import run_traditional_simulation, traditional_context_tokens, TRAVEL_OPERATIONS
+    from code_execution import run_code_execution_simulation
+    from wire_formats import get_wire_format
+
+    registries = [TRAVEL_REGISTRY] + [ToolRegistry(generate_tool_catalog(n)) for n in tool_counts]
+    for path in catalogs:
+        with open(path) as f:
+            registries.append(ToolRegistry(MCPTool(t["name"], t.get("description", ""), t.get("inputSchema", {}))
+                                           for t in json.load(f)))
+    run_traditional_simulation(TRAVEL_OPERATIONS)
+    run_code_execution_simulation(TRAVEL_OPERATIONS)
+    for registry in registries:
+        traditional_context_tokens(registry)
+        for tool in registry:
+            registry.schema_tokens(tool.name)
+    count_tokens_many(get_wire_format().encode(response) for response in MOCK_RESPONSES.values())
+    for name in MOCK_RESPONSES:
+        RESPONSE_CACHE.envelope_tokens(name)
+    if estimator:
+        from token_estimation import get_estimator
+        get_estimator()
+    return {"catalogs": len(registries), "tools": sum(len(r) for r in registries)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from wire_formats import WIRE_FORMATS
+
+    parser = argparse.ArgumentParser(description="Persistent memory-mapped token cache")
+    parser.add_argument("--dir", default=DEFAULT_TOKEN_STORE_DIR, help="Store directory")
+    parser.add_argument("--encodings", help="Comma-separated tiktoken encodings (default cl100k_base)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    warm_cmd = commands.add_parser("warm", help="Pre-populate the store")
+    warm_cmd.add_argument("--tools", default="", help="Comma-separated generated catalog sizes, e.g. 5,50,500,5000")
+    warm_cmd.add_argument("--catalog", action="append", default=[],
+                          help="JSON file with a list of MCP tool schemas (repeatable)")
+    warm_cmd.add_argument("--ids", action="store_true", help="Also store token ID arrays")
+    warm_cmd.add_argument("--wire-format", choices=sorted(WIRE_FORMATS), default="json", help="Payload encoding to warm")
+    warm_cmd.add_argument("--no-estimator", action="store_true", help="Skip the estimator's calibration texts")
+    commands.add_parser("stats", help="Print entry counts and sizes")
+    check_cmd = commands.add_parser("check", help="Concurrent multi-process put/get self-test in a temp directory")
+    check_cmd.add_argument("--processes", type=int, default=4)
+    check_cmd.add_argument("--entries", type=int, default=2000, help="Distinct keys per run")
+
+    args = parser.parse_args()
+
+    from token_counter import active_encodings, persistent_stores, set_encodings, set_persistent_store
+    if args.command == "check":
+        print(f"[Self-test passed: {json.dumps(self_test(args.processes, args.entries))}]")
+        sys.exit(0)
+    if args.encodings:
+        set_encodings(*[e.strip() for e in args.encodings.split(",") if e.strip()])
+    if args.command == "warm":
+        from wire_formats import set_wire_format
+        set_wire_format(args.wire_format)
+        set_persistent_store(args.dir, args.ids)
+        start = time.perf_counter()
+        result = warm([int(n) for n in args.tools.split(",") if n.strip()], args.catalog, not args.no_estimator)
+        print(f"[Warmed {result['catalogs']} catalogs ({result['tools']:,} tools) "
+              f"in {time.perf_counter() - start:.1f}s: {args.dir}]")
+        stores = persistent_stores()
+    else:
+        try:
+            stores = [TokenStore(args.dir, name, readonly=True) for name in active_encodings()]
+        except FileNotFoundError as e:
+            sys.exit(f"{e} (run: python token_store.py warm)")
+    for store in stores:
+        print(json.dumps(store.stats()))
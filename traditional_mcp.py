@@ -1,8 +1,14 @@
 """Traditional MCP Architecture simulation - O(N×M) token pattern."""
 from __future__ import annotations
 import json
-from token_counter import count_tokens, TokenMetrics, TokenAccumulator
-from mock_mcp_server import TRAVEL_MCP_TOOLS, get_all_tools_json, get_mock_response
+from token_counter import count_tokens, count_tokens_many, count_tokens_stream, TokenMetrics, TokenAccumulator
+from instrumentation import stage
+from typing import TYPE_CHECKING, Iterable
+from mock_mcp_server import MCPTool, ToolRegistry, RESPONSE_CACHE, as_registry, get_all_tools_json, result_envelope
+from wire_formats import JSON_INDENT, get_wire_format
+
+if TYPE_CHECKING:
+    from token_estimation import ToolCallEstimator
 
 SYSTEM_PROMPT = """You are a travel assistant with MCP tools.
 1. Analyze which tools are needed
@@ -10,38 +16,92 @@ SYSTEM_PROMPT = """You are a travel assistant with MCP tools.
 3. Process results and respond
 Use JSON-RPC 2.0 format for tool calls."""
 
-def build_tools_context() -> str:
+def build_tools_context(tools: ToolRegistry | Iterable[MCPTool] | None = None) -> str:
     """Build full tool definitions context."""
-    return f"## MCP Tools\n```json\n{get_all_tools_json()}\n```"
-
-def simulate_tool_discovery() -> int:
-    """Simulate tools/list discovery call, return token count."""
-    request = json.dumps({"jsonrpc": "2.0", "method": "tools/list", "params": {}}, indent=2)
-    response = json.dumps({"result": {"tools": [t.to_schema() for t in TRAVEL_MCP_TOOLS]}}, indent=2)
-    return count_tokens(request + response)
-
-def simulate_tool_call(tool_name: str, args: dict) -> TokenMetrics:
-    """Simulate a single tool call, return token metrics."""
-    reasoning = f"Using '{tool_name}' tool with params:\n{json.dumps(args, indent=2)}"
-    request = json.dumps({"method": "tools/call", "params": {"name": tool_name, "arguments": args}}, indent=2)
-    response = json.dumps({"result": {"content": [{"text": get_mock_response(tool_name)}]}}, indent=2)
-    processing = f"Received {tool_name} response, extracting relevant information..."
+    return f"## MCP Tools\n```json\n{get_all_tools_json(tools)}\n```"
+
+def simulate_tool_discovery(tools: ToolRegistry | Iterable[MCPTool] | None = None) -> int:
+    """Simulate tools/list discovery call, return token count (cached per registry version)."""
+    registry = as_registry(tools)
+    
+    def discovery_tokens() -> int:
+        fmt = get_wire_format()
+        with stage("discovery.serialize"):
+            request = fmt.envelope({"jsonrpc": "2.0", "method": "tools/list", "params": {}})
+            if fmt is JSON_INDENT:
+                # Same text as json.dumps({"result": {"tools": [...]}}, indent=2), spliced from cached schemas
+                response = '{\n  "result": {\n    "tools": ' + registry.tools_json(2) + '\n  }\n}'
+            else:
+                prefix, suffix = fmt.wrap({"result": {"tools": "\x00"}})
+                response = prefix + registry.tools_json() + suffix
+        with stage("discovery.tokenize"):
+            return count_tokens(request + response)
+    return registry.memo("discovery_tokens", discovery_tokens)
+
+def simulate_tool_call(tool_name: str, args: dict, response_text: str | None = None) -> TokenMetrics:
+    """Simulate a single tool call, return token metrics (mock response unless one is given)."""
+    fmt = get_wire_format()
+    with stage("tool_call.serialize"):
+        reasoning = f"Using '{tool_name}' tool with params:\n{fmt.encode(args)}"
+        request = fmt.envelope({"method": "tools/call", "params": {"name": tool_name, "arguments": args}})
+        processing = f"Received {tool_name} response, extracting relevant information..."
+        texts = [reasoning, processing, request]
+        if response_text is not None:
+            prefix, suffix = result_envelope()
+            texts.append(prefix.decode() + json.dumps(response_text) + suffix.decode())
+    with stage("tool_call.tokenize"):
+        counts = count_tokens_many(texts)
+        # Mock envelopes are pre-encoded and counted once per tool
+        reasoning_n, processing_n, request_n = counts[:3]
+        response_n = counts[3] if response_text is not None else RESPONSE_CACHE.envelope_tokens(tool_name)
     return TokenMetrics(
-        reasoning_tokens=count_tokens(reasoning) + count_tokens(processing),
-        tool_call_tokens=count_tokens(request),
-        response_tokens=count_tokens(response)
+        reasoning_tokens=reasoning_n + processing_n,
+        tool_call_tokens=request_n,
+        response_tokens=response_n
     )
 
-def run_traditional_simulation(operations: list[dict]) -> TokenAccumulator:
-    """Run full Traditional MCP simulation."""
-    acc = TokenAccumulator("Traditional MCP")
-    acc.initial_context_tokens = count_tokens(SYSTEM_PROMPT + build_tools_context()) + simulate_tool_discovery()
+def count_response_stream(chunks: Iterable[str]) -> int:
+    """Response tokens for a tool result streamed as text chunks, without joining them.
     
-    context_reload = count_tokens(build_tools_context()) // 2  # Partial context reload per op
-    for op in operations:
-        metrics = simulate_tool_call(op["tool"], op["args"])
-        metrics.context_tokens = context_reload
-        acc.add_operation(metrics)
+    Equal to simulate_tool_call(name, args, "".join(chunks)).response_tokens.
+    """
+    prefix, suffix = result_envelope()
+    
+    def envelope() -> Iterable[str]:
+        yield prefix.decode() + '"'
+        for chunk in chunks:
+            yield json.dumps(chunk)[1:-1]  # JSON string escaping is per character, so chunks escape independently
+        yield '"' + suffix.decode()
+    with stage("tool_call.tokenize_stream"):
+        return count_tokens_stream(envelope())
+
+def traditional_context_tokens(tools: ToolRegistry | Iterable[MCPTool] | None = None) -> tuple[int, int]:
+    """(initial context incl. discovery, per-operation context reload) for a catalog."""
+    registry = as_registry(tools)
+    with stage("traditional.context"):
+        tools_context = registry.memo("tools_context", lambda: build_tools_context(registry))
+        initial = (registry.memo("initial_context_tokens", lambda: count_tokens(SYSTEM_PROMPT + tools_context))
+                   + simulate_tool_discovery(registry))
+        
+        # Partial context reload per op
+        context_reload = registry.memo("context_reload_tokens", lambda: count_tokens(tools_context) // 2)
+    return initial, context_reload
+
+def run_traditional_simulation(operations: list[dict], tools: ToolRegistry | Iterable[MCPTool] | None = None,
+                               estimator: ToolCallEstimator | None = None) -> TokenAccumulator:
+    """Run full Traditional MCP simulation (defaults to the travel tool set).
+    
+    With an estimator, per-call metrics are estimated compositionally instead of counted exactly.
+    """
+    acc = TokenAccumulator("Traditional MCP")
+    acc.initial_context_tokens, context_reload = traditional_context_tokens(tools)
+    call = simulate_tool_call if estimator is None else estimator.estimate
+    with stage("traditional.operations"):
+        for op in operations:
+            metrics = call(op["tool"], op["args"])
+            with stage("traditional.accounting"):
+                metrics.context_tokens = context_reload
+                acc.add_operation(metrics)
     return acc
 
 # Test operations for travel planning scenario
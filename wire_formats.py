@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Pluggable wire formats for simulated payloads.
+
+A WireFormat encodes the payloads the model reads (tool schemas, tool
+arguments, tool results, batch documents) and decodes them back; the
+JSON-RPC envelopes around those payloads stay JSON, indented only under
+the default format. Built-in formats:
+
+  json     json.dumps(obj, indent=2), what the simulations always used
+  compact  JSON without whitespace
+  tabular  compact JSON skeleton plus CSV blocks for homogeneous lists of
+           flat objects (flight and hotel results), typed per column
+  keydict  compact JSON with object keys replaced by short codes and a
+           frequency-ordered key legend
+
+set_wire_format() selects the active format for both paradigms and the
+mock server (caches keyed on wire_format_epoch() are rebuilt). The CLI
+compares tokens per format against encode/decode throughput.
+
+Run with: python wire_formats.py --rows 1000
+"""
+from __future__ import annotations
+import csv
+import io
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Placeholder for splitting envelopes around a payload; json.dumps renders it as "\u0000"
+_SLOT = "\x00"
+_SLOT_JSON = json.dumps(_SLOT)
+
+
+@dataclass(frozen=True)
+class WireFormat:
+    """A named payload encoding plus the indentation of the JSON envelopes around it."""
+    name: str
+    encode: Callable[[object], str]
+    decode: Callable[[str], object]
+    envelope_indent: Optional[int] = None
+    description: str = ""
+
+    def envelope(self, obj) -> str:
+        """Serialize a protocol envelope (JSON-RPC request/result) for this format."""
+        if self.envelope_indent is None:
+            return json.dumps(obj, separators=(",", ":"))
+        return json.dumps(obj, indent=self.envelope_indent)
+
+    def wrap(self, template) -> tuple[str, str]:
+        """Envelope text before and after the single _SLOT value in template."""
+        prefix, _, suffix = self.envelope(template).partition(_SLOT_JSON)
+        return prefix, suffix
+
+
+def _compact(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+# --- tabular ---------------------------------------------------------------
+
+_TABLE = "@table"  # Reserved marker key: {"@table": n} in the skeleton refers to CSV block n
+_CELL_TYPES = {str: "s", int: "i", float: "f", bool: "b"}
+_PARSE_CELL = {"s": str, "i": int, "f": float, "b": lambda c: c == "true", "j": json.loads}
+
+
+def _is_table(value) -> bool:
+    if not isinstance(value, list) or len(value) < 2 or not isinstance(value[0], dict) or not value[0]:
+        return False
+    keys = list(value[0])
+    return all(isinstance(row, dict) and list(row) == keys
+               and not any(isinstance(v, (dict, list)) for v in row.values()) for row in value)
+
+
+def _column_type(values: list) -> str:
+    types = {type(v) for v in values}
+    return _CELL_TYPES.get(types.pop(), "j") if len(types) == 1 else "j"
+
+
+def _encode_tabular(obj) -> str:
+    tables = []
+
+    def extract(value):
+        if _is_table(value):
+            tables.append(value)
+            return {_TABLE: len(tables) - 1}
+        if isinstance(value, dict):
+            return {k: extract(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [extract(v) for v in value]
+        return value
+
+    out = io.StringIO()
+    out.write(_compact(extract(obj)))
+    writer = csv.writer(out, lineterminator="\n")
+    for i, rows in enumerate(tables):
+        keys = list(rows[0])
+        types = [_column_type([row[k] for row in rows]) for k in keys]
+        out.write(f"\n{_TABLE} {i} {len(rows)}\n")
+        writer.writerow(f"{k}:{t}" for k, t in zip(keys, types))
+        for row in rows:
+            writer.writerow([json.dumps(v) if t in "jb" else v for v, t in zip(row.values(), types)])
+    text = out.getvalue()
+    return text[:-1] if tables else text
+
+
+def _decode_tabular(text: str):
+    skeleton, _, rest = text.partition("\n")
+    tables = {}
+    reader = csv.reader(io.StringIO(rest))
+    for marker in reader:
+        _, index, count = marker[0].split(" ")
+        columns = [c.rpartition(":") for c in next(reader)]
+        tables[int(index)] = [
+            {name: _PARSE_CELL[t](cell) for (name, _, t), cell in zip(columns, next(reader))}
+            for _ in range(int(count))
+        ]
+
+    def restore(value):
+        if isinstance(value, dict):
+            if len(value) == 1 and _TABLE in value:
+                return tables[value[_TABLE]]
+            return {k: restore(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [restore(v) for v in value]
+        return value
+
+    return restore(json.loads(skeleton))
+
+
+# --- keydict ---------------------------------------------------------------
+
+def _key_code(i: int) -> str:
+    code = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        code = chr(97 + r) + code
+    return code
+
+
+def _encode_keydict(obj) -> str:
+    counts: Counter = Counter()
+
+    def count(value):
+        if isinstance(value, dict):
+            counts.update(value.keys())
+            for v in value.values():
+                count(v)
+        elif isinstance(value, list):
+            for v in value:
+                count(v)
+
+    count(obj)
+    legend = [k for k, _ in counts.most_common()]
+    codes = {k: _key_code(i) for i, k in enumerate(legend)}
+
+    def remap(value):
+        if isinstance(value, dict):
+            return {codes[k]: remap(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [remap(v) for v in value]
+        return value
+
+    return _compact({"@keys": legend, "@data": remap(obj)})
+
+
+def _decode_keydict(text: str):
+    doc = json.loads(text)
+    keys = {_key_code(i): k for i, k in enumerate(doc["@keys"])}
+
+    def restore(value):
+        if isinstance(value, dict):
+            return {keys[k]: restore(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [restore(v) for v in value]
+        return value
+
+    return restore(doc["@data"])
+
+
+JSON_INDENT = WireFormat("json", lambda obj: json.dumps(obj, indent=2), json.loads, 2, "Indented JSON (indent=2)")
+WIRE_FORMATS: dict[str, WireFormat] = {f.name: f for f in (
+    JSON_INDENT,
+    WireFormat("compact", _compact, json.loads, None, "JSON without whitespace"),
+    WireFormat("tabular", _encode_tabular, _decode_tabular, None, "JSON skeleton + typed CSV blocks for homogeneous lists"),
+    WireFormat("keydict", _encode_keydict, _decode_keydict, None, "Compact JSON with a short-code key dictionary"),
+)}
+
+_active = JSON_INDENT
+_epoch = 0
+
+
+def register_wire_format(fmt: WireFormat) -> None:
+    WIRE_FORMATS[fmt.name] = fmt
+
+
+def set_wire_format(name: str) -> WireFormat:
+    """Select the format used by both paradigms and the mock server."""
+    global _active, _epoch
+    if name not in WIRE_FORMATS:
+        raise ValueError(f"unknown wire format {name!r} (have {sorted(WIRE_FORMATS)})")
+    if WIRE_FORMATS[name] is not _active:
+        _active = WIRE_FORMATS[name]
+        _epoch += 1
+    return _active
+
+
+def get_wire_format() -> WireFormat:
+    return _active
+
+
+def wire_format_epoch() -> int:
+    """Changes whenever the active format changes; include it in keys of cached encodings."""
+    return _epoch
+
+
+def benchmark_formats(payloads: dict[str, object], repeats: int = 5) -> list[dict]:
+    """Tokens, bytes and encode/decode throughput for every payload under every format."""
+    from token_counter import count_tokens
+    rows = []
+    for label, payload in payloads.items():
+        baseline = None
+        for fmt in WIRE_FORMATS.values():
+            text = fmt.encode(payload)
+            size = len(text.encode())
+            encode_s, decode_s = [], []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                fmt.encode(payload)
+                encode_s.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                decoded = fmt.decode(text)
+                decode_s.append(time.perf_counter() - start)
+            tokens = int(count_tokens(text))
+            baseline = baseline or tokens
+            encode_t, decode_t = min(encode_s), min(decode_s)
+            rows.append({
+                "payload": label, "format": fmt.name, "tokens": tokens, "bytes": size,
+                "tokens_vs_json_pct": round((tokens / baseline - 1) * 100, 1),
+                "encode_mb_s": round(size / encode_t / 1e6, 1) if encode_t > 0 else 0.0,
+                "decode_mb_s": round(size / decode_t / 1e6, 1) if decode_t > 0 else 0.0,
+                "round_trip": decoded == payload
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from mock_mcp_server import MOCK_RESPONSES, TRAVEL_MCP_TOOLS, generate_large_response
+    from code_execution import BATCH_REQUEST
+
+    parser = argparse.ArgumentParser(description="Compare tokens and speed across wire formats")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows in the generated large responses")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+
+    payloads = {f"response:{name}": body for name, body in MOCK_RESPONSES.items()}
+    payloads["tool_schemas"] = [t.to_schema() for t in TRAVEL_MCP_TOOLS]
+    payloads["batch_request"] = BATCH_REQUEST
+    payloads[f"search_flights[{args.rows}]"] = generate_large_response("search_flights", args.rows)
+    payloads[f"search_hotels[{args.rows}]"] = generate_large_response("search_hotels", args.rows)
+    rows = benchmark_formats(payloads, args.repeats)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'Payload':<28} {'Format':<8} {'Tokens':>10} {'vs json':>8} {'Bytes':>10} "
+              f"{'Enc MB/s':>9} {'Dec MB/s':>9} {'OK':>3}")
+        for r in rows:
+            print(f"{r['payload']:<28} {r['format']:<8} {r['tokens']:>10,} {r['tokens_vs_json_pct']:>+7.1f}% "
+                  f"{r['bytes']:>10,} {r['encode_mb_s']:>9.1f} {r['decode_mb_s']:>9.1f} {'✓' if r['round_trip'] else '✗':>3}")
+        totals = Counter()
+        for r in rows:
+            totals[r["format"]] += r["tokens"]
+        print("\nTotal tokens: " + " | ".join(f"{name} {n:,}" for name, n in totals.items()))